@@ -0,0 +1,334 @@
+import os
+import string
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from Processing.qrcode import base, constants, exceptions, main, util
+
+# Bytes suffixes are drawn from
+ALPHABET = np.frombuffer(string.ascii_letters.encode(), dtype=np.uint8)
+# Number of set bits of every byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+# Characters of the alphanumeric mode, by byte
+IS_ALPHA_NUM = np.zeros(256, dtype=bool)
+IS_ALPHA_NUM[np.frombuffer(util.ALPHA_NUM, dtype=np.uint8)] = True
+# QRCode.add_data splits off numeric or alphanumeric runs at least this long
+OPTIMIZE_MINIMUM = 20
+
+
+class CandidateSearch:
+    """
+    Search for the suffix that, appended to s2, gives the QR code closest to the
+    code of s1, both at the same version and error correction with mask 0
+
+    Both codes share every function pattern, so the modules they differ in are
+    the differing bits of their final (interleaved data and error correction)
+    codewords. Candidates are encoded straight to codewords in batches, with
+    the byte mode bit stream built by array shifts and the Reed-Solomon
+    codewords from the table-driven base.rs_encode_batch, and scored by XOR and
+    popcount against s1's codewords. Candidates that QRCode would not encode as
+    a single byte mode chunk go through util.create_data instead
+    """
+
+    errorCorrection = {"L": constants.ERROR_CORRECT_L, "M": constants.ERROR_CORRECT_M, "Q": constants.ERROR_CORRECT_Q, "H": constants.ERROR_CORRECT_H}
+
+    def __init__(self, s1, s2, version, ecc):
+        self.s1, self.s2, self.version, self.ecc = s1, s2, version, ecc
+        self.error = self.errorCorrection[ecc]
+
+        q1 = main.QRCode(version = version, error_correction=self.error, border = 0, mask_pattern = 0)
+        q1.add_data(s1)
+        self.target = np.array(util.create_data(version, self.error, q1.data_list), dtype=np.uint8)
+
+        self.prefix = np.frombuffer(util.to_bytestring(s2), dtype=np.uint8)
+        self.count_bytes = util.length_in_bits(util.MODE_8BIT_BYTE, version) // 8
+
+        blocks = base.rs_blocks(version, self.error)
+        self.data_count = sum(block.data_count for block in blocks)
+        self.ec_count = blocks[0].total_count - blocks[0].data_count
+
+        # Mode and length header, data, then the 4 bit terminator have to fit
+        capacity = (self.data_count*8 - 4 - self.count_bytes*8 - 4) // 8
+        self.max_length = capacity - len(self.prefix)
+        if self.max_length < 1:
+            raise exceptions.DataOverflowError("No room for a suffix after s2")
+
+        # Data codewords of each block left padded with zeros to the longest
+        # block (index data_count picks a zero), and the interleaved order of
+        # data then error correction codewords
+        max_dc = max(block.data_count for block in blocks)
+        self.block_index = np.full((len(blocks), max_dc), self.data_count, dtype=np.intp)
+        data_order, offset = [], 0
+        for b, block in enumerate(blocks):
+            self.block_index[b, max_dc - block.data_count:] = np.arange(offset, offset + block.data_count)
+            offset += block.data_count
+        for i in range(max_dc):
+            data_order += [self.block_index[b, max_dc - block.data_count + i] for b, block in enumerate(blocks) if i < block.data_count]
+        ec_order = [self.data_count + b*self.ec_count + i for i in range(self.ec_count) for b in range(len(blocks))]
+        self.order = np.array(data_order + ec_order, dtype=np.intp)
+
+    def codewords(self, suffixes, lengths):
+        """
+        Final codewords of s2 followed by each suffix
+
+        Args:
+            suffixes: uint8 array of suffix bytes, one row per candidate (bytes past its length are ignored)
+            lengths: Length of each candidate's suffix
+
+        Returns:
+            uint8 array of (candidates, total codewords), rows of candidates that
+            overflow the version are all zero
+        """
+        lengths = np.asarray(lengths, dtype=np.intp)
+        result = self._byte_mode_codewords(suffixes, lengths)
+
+        for row in np.flatnonzero(self._needs_chunks(suffixes, lengths)):
+            value = bytes(self.prefix) + bytes(suffixes[row, :lengths[row]])
+            try:
+                result[row] = util.create_data(self.version, self.error, list(util.optimal_data_chunks(value, minimum=OPTIMIZE_MINIMUM)))
+            except exceptions.DataOverflowError:
+                result[row] = 0
+        return result
+
+    def _byte_mode_codewords(self, suffixes, lengths):
+        # Codewords of the values encoded as one byte mode chunk. For a given
+        # suffix length these are affine in the suffix bits: the data codewords
+        # are the bytes shifted a nibble, and Reed-Solomon is linear
+        count = len(lengths)
+        width = suffixes.shape[1]
+        start = self.count_bytes + len(self.prefix)
+        sizes = len(self.prefix) + lengths
+
+        # Bytes after the mode nibble: length field, s2, suffix, then a zero
+        # byte whose high nibble is the terminator
+        stream = np.zeros((count, self.data_count), dtype=np.uint8)
+        for i in range(self.count_bytes):
+            stream[:, i] = (sizes >> (8*(self.count_bytes - 1 - i))) & 0xFF
+        stream[:, self.count_bytes:start] = self.prefix
+        columns = np.arange(width)
+        stream[:, start:start + width] = np.where(columns < lengths[:, np.newaxis], suffixes, 0)
+
+        # Shifted a nibble right behind the byte mode indicator 0100
+        data = np.empty_like(stream)
+        data[:, 0] = 0x40 | (stream[:, 0] >> 4)
+        data[:, 1:] = (stream[:, :-1] << 4) | (stream[:, 1:] >> 4)
+
+        # Alternating pad codewords after the terminator
+        filled = start + lengths + 1
+        position = np.arange(self.data_count) - filled[:, np.newaxis]
+        data = np.where(position >= 0, np.where(position % 2 == 0, util.PAD0, util.PAD1), data).astype(np.uint8)
+
+        padded = np.concatenate([data, np.zeros((count, 1), dtype=np.uint8)], axis=1)[:, self.block_index]
+        ec = base.rs_encode_batch(padded.reshape(-1, padded.shape[2]), self.ec_count).reshape(count, -1)
+        return np.concatenate([data, ec], axis=1)[:, self.order]
+
+    def _needs_chunks(self, suffixes, lengths):
+        # QRCode.add_data splits a value into several chunks when it holds a run
+        # of OPTIMIZE_MINIMUM numeric/alphanumeric characters, or makes it one
+        # numeric/alphanumeric chunk when it is no longer than that and all of
+        # them. Either way the value has an alphanumeric run as long as
+        # min(size, OPTIMIZE_MINIMUM)
+        width = suffixes.shape[1]
+        alpha_num = np.concatenate([
+            np.broadcast_to(IS_ALPHA_NUM[self.prefix], (len(lengths), len(self.prefix))),
+            IS_ALPHA_NUM[suffixes] & (np.arange(width) < lengths[:, np.newaxis]),
+        ], axis=1)
+        sizes = len(self.prefix) + lengths
+
+        runs = np.zeros((len(lengths), alpha_num.shape[1] + 1), dtype=np.int32)
+        np.cumsum(alpha_num, axis=1, out=runs[:, 1:])
+        window = min(OPTIMIZE_MINIMUM, alpha_num.shape[1])
+        long_run = (runs[:, window:] - runs[:, :-window] == window).any(axis=1)
+        return np.where(sizes > OPTIMIZE_MINIMUM, long_run, runs[:, -1] == sizes)
+
+    def distances(self, suffixes, lengths):
+        """
+        Number of modules each candidate's code differs from s1's code in
+        (the number of modules for candidates that overflow the version)
+        """
+        codewords = self.codewords(suffixes, lengths)
+        distance = POPCOUNT[codewords ^ self.target].sum(axis=1, dtype=np.int64)
+        overflow = ~codewords.any(axis=1)
+        distance[overflow] = (self.version*4 + 17)**2
+        return distance
+
+    def random_suffixes(self, rng, count):
+        """count random suffixes of 1 to max_length letters, as (suffixes, lengths)"""
+        lengths = rng.integers(1, self.max_length + 1, size=count)
+        suffixes = ALPHABET[rng.integers(0, len(ALPHABET), size=(count, int(lengths.max())))]
+        return suffixes, lengths
+
+    def randomSearch(self, trials=100, seed=None, batch_size=1024):
+        """
+        Score trials random suffixes, batch_size at a time
+
+        Returns:
+            (suffix, distance) of the closest, the first found on ties
+        """
+        rng = np.random.default_rng(seed)
+        best, best_distance = "", None
+        done = 0
+        while done < trials:
+            count = min(batch_size, trials - done)
+            suffixes, lengths = self.random_suffixes(rng, count)
+            distance = self.distances(suffixes, lengths)
+            i = int(np.argmin(distance))
+            if best_distance is None or distance[i] < best_distance:
+                best = bytes(suffixes[i, :lengths[i]]).decode("ascii")
+                best_distance = int(distance[i])
+            done += count
+        return best, best_distance
+
+    def letterDeltas(self, suffix, position, base):
+        """
+        Change to the byte mode codewords of suffix (whose codewords are base)
+        for each letter put at position, as a (letters, total codewords) array
+
+        The change only depends on the bits flipped at position, so it is
+        worked out from the 8 single bit flips rather than by encoding a
+        candidate per letter
+        """
+        flips = np.repeat(suffix[np.newaxis], 8, axis=0)
+        flips[:, position] ^= (1 << np.arange(8)).astype(np.uint8)
+        basis = self._byte_mode_codewords(flips, np.full(8, len(suffix))) ^ base
+
+        # Change for every flipped byte value, each bit adding its basis row
+        table = np.zeros((256, len(base)), dtype=np.uint8)
+        for bit in range(8):
+            table[1 << bit:2 << bit] = table[:1 << bit] ^ basis[bit]
+        return table[ALPHABET ^ suffix[position]]
+
+    def guidedSearch(self, trials=1000, beam_width=1, seed=None, batch_size=1024):
+        """
+        Search for the closest suffix by beam search over its bytes: start from
+        the best random suffixes, then sweep the positions, trying every letter
+        at each position of each suffix in the beam and keeping the beam_width
+        best results. A beam_width of 1 is greedy coordinate descent. When a
+        sweep improves nothing, the rest of the trials go to new starts
+
+        Every candidate scored (random starts, letters tried and the 8 encodes
+        each position costs) counts as a trial
+
+        Returns:
+            (suffix, distance) of the closest
+        """
+        rng = np.random.default_rng(seed)
+        best, best_distance = "", None
+        spent = 0
+
+        while spent < trials:
+            # A tenth of what's left on random starts, the rest on sweeping them
+            count = max(beam_width, min(batch_size, (trials - spent) // 10))
+            suffixes, lengths = self.random_suffixes(rng, count)
+            distance = self.distances(suffixes, lengths)
+            spent += count
+
+            beam = []
+            for i in np.argsort(distance, kind="stable")[:beam_width]:
+                suffix = suffixes[i, :lengths[i]].copy()
+                beam.append((int(distance[i]), suffix, self._byte_mode_codewords(suffix[np.newaxis], np.array([len(suffix)]))[0]))
+
+            improved = True
+            while improved and spent < trials:
+                improved = False
+                for position in range(max(len(suffix) for _, suffix, _ in beam)):
+                    step_cost = sum(len(ALPHABET) + 8 for _, suffix, _ in beam if position < len(suffix))
+                    if spent + step_cost > trials:
+                        break
+                    spent += step_cost
+
+                    # Estimated distances of every state/letter pair, then the
+                    # exact distances of the beam_width best distinct suffixes
+                    options = []
+                    for state, (_, suffix, base) in enumerate(beam):
+                        if position >= len(suffix):
+                            options.append((beam[state][0], state, None, base))
+                            continue
+                        changed = base ^ self.letterDeltas(suffix, position, base)
+                        estimate = POPCOUNT[changed ^ self.target].sum(axis=1, dtype=np.int64)
+                        options += [(int(estimate[j]), state, j, changed[j]) for j in range(len(ALPHABET))]
+                    options.sort(key=lambda option: option[0])
+
+                    chosen, seen = [], set()
+                    for estimate, state, letter, codewords in options:
+                        suffix = beam[state][1].copy()
+                        if letter is not None:
+                            suffix[position] = ALPHABET[letter]
+                        if suffix.tobytes() in seen:
+                            continue
+                        seen.add(suffix.tobytes())
+                        chosen.append((suffix, codewords))
+                        if len(chosen) == beam_width:
+                            break
+
+                    # Values QRCode splits into chunks don't follow the byte
+                    # mode estimate, their exact distance decides
+                    exact = self.distances(self._pad_rows([suffix for suffix, _ in chosen]), [len(suffix) for suffix, _ in chosen])
+                    new_beam = sorted(((int(d), suffix, codewords) for d, (suffix, codewords) in zip(exact, chosen)), key=lambda state: state[0])
+                    if new_beam[0][0] < beam[0][0]:
+                        improved = True
+                    beam = new_beam
+                    best, best_distance = self._closest(beam, best, best_distance)
+
+            best, best_distance = self._closest(beam, best, best_distance)
+        return best, best_distance
+
+    def _closest(self, beam, best, best_distance):
+        distance, suffix, _ = beam[0]
+        if best_distance is None or distance < best_distance:
+            return bytes(suffix).decode("ascii"), distance
+        return best, best_distance
+
+    def _pad_rows(self, suffixes):
+        rows = np.zeros((len(suffixes), max(len(suffix) for suffix in suffixes)), dtype=np.uint8)
+        for row, suffix in zip(rows, suffixes):
+            row[:len(suffix)] = suffix
+        return rows
+
+    def search(self, trials=100, workers=None, seed=None, batch_size=1024, method="random", beam_width=8):
+        """
+        Search for the suffix closest to s1's code
+
+        Args:
+            trials: Number of candidate suffixes to score
+            workers: Processes to split the trials over (default: search in this process)
+            seed: Seed for reproducible searches
+            batch_size: Candidates encoded and scored at a time
+            method: "random" to score random suffixes, "greedy" for coordinate
+                descent over the suffix bytes, "beam" for a beam search
+            beam_width: Suffixes kept by the beam search
+
+        Returns:
+            (s2 with the best suffix appended, modules it differs from s1's code in)
+        """
+        if method not in SEARCH_METHODS:
+            raise ValueError(f"Unknown search method: {method}")
+        if method != "beam":
+            beam_width = 1
+
+        if not workers or workers <= 1:
+            suffix, distance = _search(self, method, trials, seed, batch_size, beam_width)
+            return self.s2 + suffix, distance
+
+        workers = min(workers, trials)
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        shares = [trials // workers + (i < trials % workers) for i in range(workers)]
+        jobs = [(self.s1, self.s2, self.version, self.ecc, method, share, s, batch_size, beam_width) for share, s in zip(shares, seeds)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_search_chunk, jobs))
+        suffix, distance = min(results, key=lambda result: result[1])
+        return self.s2 + suffix, distance
+
+
+SEARCH_METHODS = ("random", "greedy", "beam")
+
+
+def _search(engine, method, trials, seed, batch_size, beam_width):
+    if method == "random":
+        return engine.randomSearch(trials, seed, batch_size)
+    return engine.guidedSearch(trials, beam_width, seed, batch_size)
+
+
+def _search_chunk(job):
+    s1, s2, version, ecc, method, trials, seed, batch_size, beam_width = job
+    return _search(CandidateSearch(s1, s2, version, ecc), method, trials, seed, batch_size, beam_width)
@@ -2,6 +2,7 @@ import os
 import cv2
 import csv
 import random
+import zlib
 import numpy as np
 
 import svgwrite
@@ -17,44 +18,117 @@ class Modify_Image:
     def scaleImg(self, img, scale):
         return np.repeat(np.repeat(img, scale, axis=0), scale, axis=1)
     
+    def colorRuns(self, img, cell_size=1):
+        """
+        Split an image into single color rectangles: runs of equal pixels along a
+        row, each extended down over the rows where the same run repeats
+        
+        Args:
+            img: Grayscale (h, w) or RGB (h, w, 3) image
+            cell_size: Size in pixels of one element of img in the output
+        
+        Returns:
+            Dict of (r, g, b) color -> list of (x, y, width, height) rectangles
+        """
+        img = np.asarray(img)
+        if img.ndim == 2:
+            keys = img.astype(np.int64) * 0x010101
+        else:
+            keys = (img[:, :, 0].astype(np.int64) << 16) | (img[:, :, 1].astype(np.int64) << 8) | img[:, :, 2]
+        h, w = keys.shape
+        
+        runs = {}
+        # (x0, x1, color) -> first row of a run still being extended
+        open_runs = {}
+        
+        def close(run, y_end):
+            x0, x1, key = run
+            y0 = open_runs.pop(run)
+            runs.setdefault(key, []).append((x0*cell_size, y0*cell_size, (x1-x0)*cell_size, (y_end-y0)*cell_size))
+        
+        # Only rows that differ from the one above can start or end a run
+        for y in np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)]).tolist():
+            row = keys[y]
+            x_starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]])
+            x_ends = np.r_[x_starts[1:], w]
+            row_runs = set(zip(x_starts.tolist(), x_ends.tolist(), row[x_starts].tolist()))
+            
+            for run in [run for run in open_runs if run not in row_runs]:
+                close(run, y)
+            for run in row_runs:
+                open_runs.setdefault(run, y)
+        
+        for run in list(open_runs):
+            close(run, h)
+        
+        return {(key >> 16, (key >> 8) & 0xFF, key & 0xFF): rects for key, rects in runs.items()}
+    
+    def backgroundColor(self, runs):
+        return max(runs, key=lambda color: sum(rw*rh for _, _, rw, rh in runs[color]))
+    
+    def matrixToSVG(self, img, svgFile, cell_size=1):
+        """
+        Write an image as an SVG with a background rectangle and one path per other
+        color, built from colorRuns
+        """
+        img = np.asarray(img)
+        h, w = img.shape[0]*cell_size, img.shape[1]*cell_size
+        runs = self.colorRuns(img, cell_size)
+        background = self.backgroundColor(runs)
+        
+        dwg = svgwrite.Drawing(svgFile, profile="tiny", size=(w, h), debug=False)
+        dwg.add(dwg.rect(insert=(0, 0), size=(w, h), fill=f"rgb{background}"))
+        
+        for color, rects in runs.items():
+            if color == background:
+                continue
+            d = "".join(f"M{x} {y}h{rw}v{rh}h-{rw}z" for x, y, rw, rh in rects)
+            dwg.add(dwg.path(d=d, fill=f"rgb{color}", shape_rendering="crispEdges"))
+        
+        dwg.save()
+    
+    def matrixToPDF(self, img, pdfFile, cell_size=1):
+        """
+        Write an image as a single page vector PDF, one pixel per point, filling
+        the rectangles from colorRuns one color at a time
+        """
+        img = np.asarray(img)
+        h, w = img.shape[0]*cell_size, img.shape[1]*cell_size
+        runs = self.colorRuns(img, cell_size)
+        background = self.backgroundColor(runs)
+        
+        content = ["%.4g %.4g %.4g rg 0 0 %d %d re f" % (*[c/255 for c in background], w, h)]
+        for color, rects in runs.items():
+            if color == background:
+                continue
+            content.append("%.4g %.4g %.4g rg" % tuple(c/255 for c in color))
+            # PDF puts the origin at the bottom left
+            content.extend(f"{x} {h-y-rh} {rw} {rh} re" for x, y, rw, rh in rects)
+            content.append("f")
+        stream = zlib.compress("\n".join(content).encode("ascii"), 9)
+        
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << >> /Contents 4 0 R >>" % (w, h),
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        ]
+        
+        with open(pdfFile, "wb") as f:
+            f.write(b"%PDF-1.4\n")
+            offsets = []
+            for i, obj in enumerate(objects, 1):
+                offsets.append(f.tell())
+                f.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+            xref = f.tell()
+            f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+            for offset in offsets:
+                f.write(b"%010d 00000 n \n" % offset)
+            f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    
     def convertToSVG(self, pngFile, svgFile):
         img = Image.open(pngFile).convert("RGB")
-        arr = np.array(img)
-        h, w, _ = arr.shape
-
-        visited = np.zeros((h, w), dtype=bool)
-        dwg = svgwrite.Drawing(svgFile, profile="tiny", size=(w, h), fill="white")
-
-        for y in range(h):
-            for x in range(w):
-                if visited[y, x]:
-                    continue
-
-                base_color = tuple(arr[y, x])
-                max_size = min(h - y, w - x)
-                square_size = 1
-                while square_size <= max_size:
-                    region = arr[y:y+square_size, x:x+square_size]
-                    if region.shape[0] != square_size or region.shape[1] != square_size:
-                        break
-                    if not np.all(region == region[0, 0]):
-                        break
-                    square_size += 1
-
-                square_size -= 1 
-
-                if square_size > 0:
-                    visited[y:y+square_size, x:x+square_size] = True
-                    rgb = f"rgb{base_color}"
-                    dwg.add(dwg.rect(
-                        insert=(x, y),
-                        size=(square_size, square_size),
-                        fill=rgb,
-                        stroke=rgb,
-                        stroke_width=0
-                    ))
-
-        dwg.save()
+        self.matrixToSVG(np.array(img), svgFile)
     
     def convertToEPS(self, svgFile, epsFile):
         cairosvg.svg2eps(url=svgFile, write_to=epsFile)
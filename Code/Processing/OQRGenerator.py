@@ -1,10 +1,14 @@
 import os
 import cv2
+import math
 import csv
 import random
 import numpy as np
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 
-from Processing.qrcode import constants, main
+from Processing.qrcode import constants, exceptions, main
 from Processing.ImageModification import Modify_Image
 from Processing.QRHelper import QR_Helper
 from Processing.ValueGenerator import ValueGenerator
@@ -12,21 +16,40 @@ from Processing.ValueGenerator import ValueGenerator
 class OQR_Generator:
     
     qr_helper = QR_Helper()
+    image_modifier = Modify_Image()
     
     ecc_mapping =  {"L": constants.ERROR_CORRECT_L, "M": constants.ERROR_CORRECT_M, "Q": constants.ERROR_CORRECT_Q, "H": constants.ERROR_CORRECT_H}
     patterns = [[10,10,10,10,10], [5,15,10,15,5], [10, 7, 16, 7, 10], [7,10,16,10,7]]
+    # Pixels per module for each OQR type
+    scales = {"2": 50, "3": 150}
+    # Size in pixels of the finest detail each type draws (CDP arms and cross
+    # bars are multiples of it), composed images are uniform over such cells
+    cell_sizes = {"2": 10, "3": 10}
+    # Shortest run of numeric/alphanumeric characters QRCode.add_data encodes
+    # as a chunk of its own (its optimize argument)
+    chunk_minimum = 20
     
     def __init__(self):
         pass
     
-    def merge_nf(self, nqr, fqr, scale = 50):
-        nqr_np = 1-np.array(nqr, dtype=int)
-        fqr_np = 1-np.array(fqr, dtype=int)
-
-        mismatch_coords = np.argwhere(nqr_np != fqr_np)
-        scaled = np.repeat(np.repeat(fqr_np, scale, axis=0), scale, axis=1)
-
-        optical_pattern = np.zeros((5, 5), dtype=int)
+    def upscale_tiles(self, qr_np, scale, out=None):
+        """
+        Upscale a module matrix by scale, returning the (rows*scale, cols*scale)
+        image and a (rows, cols, scale, scale) view of it, where tiles[i, j] is
+        the pixel block of module (i, j)
+        
+        If out is given, the image is written into it (e.g. a region of a larger
+        canvas) instead of a new array
+        """
+        rows, cols = qr_np.shape
+        if out is None:
+            out = np.empty((rows*scale, cols*scale), dtype=qr_np.dtype)
+        blocks = out.reshape(rows, scale, cols, scale)
+        blocks[...] = qr_np[:, np.newaxis, :, np.newaxis]
+        return out, blocks.transpose(0, 2, 1, 3)
+    
+    def overlay_cdp(self, tiles, nqr_np, fqr_np, scale):
+        optical_pattern = np.zeros((5, 5), dtype=np.uint8)
         optical_pattern[2, 1:4] = 1
         optical_pattern[1:4, 2] = 1
 
@@ -34,52 +57,38 @@ class OQR_Generator:
         basic_cdp_wb = np.repeat(np.repeat(optical_pattern, scale//5, axis=0), scale//5, axis=1)
         basic_cdp_bw = 1- basic_cdp_wb
 
-        for i, j in mismatch_coords:
-            if nqr_np[i, j] == 1: 
-                scaled[i*scale:(i+1)*scale, j*scale:(j+1)*scale] = basic_cdp_wb
-            else:
-                scaled[i*scale:(i+1)*scale, j*scale:(j+1)*scale] = basic_cdp_bw
+        mismatch = nqr_np != fqr_np
+        tiles[mismatch & (nqr_np == 1)] = basic_cdp_wb
+        tiles[mismatch & (nqr_np == 0)] = basic_cdp_bw
+    
+    def merge_nf(self, nqr, fqr, scale = 50, out=None):
+        nqr_np = 1-np.asarray(nqr, dtype=np.uint8)
+        fqr_np = 1-np.asarray(fqr, dtype=np.uint8)
+
+        scaled, tiles = self.upscale_tiles(fqr_np, scale, out)
+        self.overlay_cdp(tiles, nqr_np, fqr_np, scale)
         
         return scaled
     
-    def merge_nnf(self, nnqr, nqr, fqr, scale = 150):
+    def merge_nnf(self, nnqr, nqr, fqr, scale = 150, out=None):
 
-        nnqr_np = 1-np.array(nnqr, dtype=int)
-        nqr_np = 1-np.array(nqr, dtype=int)
-        fqr_np = 1-np.array(fqr, dtype=int)
+        nnqr_np = 1-np.asarray(nnqr, dtype=np.uint8)
+        nqr_np = 1-np.asarray(nqr, dtype=np.uint8)
+        fqr_np = 1-np.asarray(fqr, dtype=np.uint8)
 
-        mismatch_coords_1 = np.argwhere(nnqr_np != nqr_np)
-        mismatch_coords_2 = np.argwhere(nqr_np != fqr_np)
-        scaled = np.repeat(np.repeat(fqr_np, scale, axis=0), scale, axis=1)
+        scaled, tiles = self.upscale_tiles(fqr_np, scale, out)
+        self.overlay_cdp(tiles, nqr_np, fqr_np, scale)
 
-        
-        optical_pattern = np.zeros((5, 5), dtype=int)
-        optical_pattern[2, 1:4] = 1
-        optical_pattern[1:4, 2] = 1
+        # Where the near-near layer differs from the near layer, draw a cross in
+        # the near-near module's color on top: a vertical bar, and a horizontal
+        # bar that is long where the near and far modules agree, short otherwise
+        mismatch = nnqr_np != nqr_np
+        same_nf = nqr_np == fqr_np
+        cross = nnqr_np[:, :, np.newaxis, np.newaxis]
 
-        basic_cdp_wb = np.repeat(np.repeat(optical_pattern, scale//5, axis=0), scale//5, axis=1)
-        basic_cdp_bw = 1- basic_cdp_wb
-
-        for i, j in mismatch_coords_2:
-            if nqr_np[i, j] == 1: 
-                scaled[i*scale:(i+1)*scale, j*scale:(j+1)*scale] = basic_cdp_wb
-            else:
-                scaled[i*scale:(i+1)*scale, j*scale:(j+1)*scale] = basic_cdp_bw
-        
-
-        for i, j in mismatch_coords_1:
-            if nqr_np[i, j] == 1: 
-                if fqr_np[i, j] == 1: 
-                    scaled[i*scale+70:i*scale+80, j*scale+50:j*scale+100] = np.zeros((10, 50), dtype=int)
-                else:
-                    scaled[i*scale+70:i*scale+80, j*scale+60:j*scale+90] = np.zeros((10, 30), dtype=int)
-                scaled[i*scale+50:i*scale+100, j*scale+70:j*scale+80] = np.zeros((50, 10), dtype=int)
-            else:
-                if fqr_np[i, j] == 1:
-                    scaled[i*scale+70:i*scale+80, j*scale+60:j*scale+90] = 1-np.zeros((10, 30), dtype=int)
-                else:
-                    scaled[i*scale+70:i*scale+80, j*scale+50:j*scale+100] = 1-np.zeros((10, 50), dtype=int)
-                scaled[i*scale+50:i*scale+100, j*scale+70:j*scale+80] = 1-np.zeros((50, 10), dtype=int)
+        tiles[:, :, 70:80, 50:100][mismatch & same_nf] = cross[mismatch & same_nf]
+        tiles[:, :, 70:80, 60:90][mismatch & ~same_nf] = cross[mismatch & ~same_nf]
+        tiles[:, :, 50:100, 70:80][mismatch] = cross[mismatch]
         return scaled
     
     def add_noise(self, img):
@@ -104,58 +113,261 @@ class OQR_Generator:
         """
         height, width = img.shape[:2]
         
-        if len(img.shape) == 2:  
-            padded_img = np.ones((height + 2*padding_size, width + 2*padding_size), dtype=img.dtype) * 255
-            padded_img[padding_size:padding_size+height, padding_size:padding_size+width] = img
-        else:  
-            padded_img = np.ones((height + 2*padding_size, width + 2*padding_size, img.shape[2]), dtype=img.dtype) * 255
-            padded_img[padding_size:padding_size+height, padding_size:padding_size+width, :] = img
+        padded_img = self.white_canvas(height, width, padding_size, img.shape[2:], img.dtype)
+        padded_img[padding_size:padding_size+height, padding_size:padding_size+width] = img
         
         return padded_img
+    
+    def white_canvas(self, height, width, padding_size, channels=(), dtype=np.uint8):
+        """
+        Allocate a white image with room for a height x width image plus padding
+        on all sides, so an image can be drawn straight into it
+        """
+        return np.full((height + 2*padding_size, width + 2*padding_size) + tuple(channels), 255, dtype=dtype)
 
-    def generateOQR(self, name, type, error, values, defaultMask=-1, padding_size=50):     
-        print("Generating OQR for ", name)
-        qrs = []
-        qrs_binary = []
-        qrs_image = []
-        generated_version = None
+    def generateLayers(self, name, error, values):
+        """
+        Encode each value as a QR code of the same version
         
+        Returns:
+            List of the layers' module matrices as uint8 arrays (1 for dark modules)
+        """
+        print("Generating OQR for ", name)
         values = [str(v) for v in values]
         
         max_len = max(len(s) for s in values)
         values = [s.ljust(max_len) for s in values]
         
-        final_values = []
+        version, values = self.alignVersions(values, [self.ecc_mapping[e] for e in error])
+        
+        qrs_binary = []
         for i, val in enumerate(values):
-            qrs.append(self.qr_helper.generateTraditionalQR(val, None, self.ecc_mapping[error[i]]))
-            qrs_binary.append(self.qr_helper.convertQRToBinary(qrs[-1]))
+            qr = self.qr_helper.generateTraditionalQR(val, version, self.ecc_mapping[error[i]])
+            qrs_binary.append(self.qr_helper.to_array(qr))
+        
+        return qrs_binary
+    
+    def alignVersions(self, values, errors):
+        """
+        Find the version all layers share, the largest any value needs, and pad
+        the values that would fit a smaller one with the fewest trailing spaces
+        that bring them up to it
+        
+        A value that skips past the version when padded (its length field or
+        encoding mode grows with it) is left as is; its code is pinned to the
+        version instead and the unused capacity filled with padding bytes
+        
+        Args:
+            values: Layer values
+            errors: Error correction constant of each layer
+        
+        Returns:
+            (version, padded values)
+        """
+        versions = [self.qr_helper.fitQRVersion(val, err) for val, err in zip(values, errors)]
+        version = max(versions)
+        if version > 40:
+            raise exceptions.DataOverflowError()
+        
+        padded = []
+        for val, err, fitted in zip(values, errors, versions):
+            if fitted == version:
+                padded.append(val)
+                continue
             
-            if generated_version is None:
-                generated_version = self.qr_helper.determineQRVersion(qrs[-1])
-            else:
-                while (not generated_version == self.qr_helper.determineQRVersion(qrs[-1])):
-                    qrs_binary.pop()
-                    qrs.pop()  
-                    val += " "
-                    qrs.append(self.qr_helper.generateTraditionalQR(val, None, self.ecc_mapping[error[i]]))
-                    qrs_binary.append(self.qr_helper.convertQRToBinary(qrs[-1]))
-                    
-            final_values.append(val)
-
-        oqr_images = None
+            # Like the one space at a time loop this replaces, take the first
+            # padding that fits the version exactly. The fitted version does
+            # not only grow with the padding: QRCode.add_data splits off runs of
+            # chunk_minimum alphanumeric characters (spaces included) as cheaper
+            # chunks, which can drop it again, so the shorter paddings are tried
+            # one by one. From chunk_minimum spaces on they always form such a
+            # chunk and the version only grows: double the padding until it
+            # reaches the version, then bisect for the fewest spaces
+            spaces = None
+            for n in range(1, self.chunk_minimum):
+                if self.qr_helper.fitQRVersion(val + " "*n, err) == version:
+                    spaces = n
+                    break
+            
+            if spaces is None:
+                low, high = self.chunk_minimum - 1, self.chunk_minimum
+                while self.qr_helper.fitQRVersion(val + " "*high, err) < version:
+                    low, high = high, high*2
+                while high - low > 1:
+                    mid = (low + high) // 2
+                    if self.qr_helper.fitQRVersion(val + " "*mid, err) < version:
+                        low = mid
+                    else:
+                        high = mid
+                if self.qr_helper.fitQRVersion(val + " "*high, err) == version:
+                    spaces = high
+            
+            if spaces is not None:
+                val += " "*spaces
+            padded.append(val)
         
+        return version, padded
+    
+    def compose(self, type, qrs_binary, out):
+        """
+        Compose the layers into out as a 0/255 image of len(qrs_binary[0])*scale pixels
+        per side, or of as many module rows as qrs_binary holds
+        """
+        scale = self.scales[type]
         if type == "2":
-            oqr_images = self.merge_nf(qrs_binary[0], qrs_binary[1], 50)
-            
-        if type == "3":
-            oqr_images = self.merge_nnf(qrs_binary[0], qrs_binary[1], qrs_binary[2], 150)
+            self.merge_nf(qrs_binary[0], qrs_binary[1], scale, out=out)
+        else:
+            self.merge_nnf(qrs_binary[0], qrs_binary[1], qrs_binary[2], scale, out=out)
+        out *= 255
+        return out
 
-        if oqr_images is not None:
-            scaled_image = (oqr_images * 255).astype(np.uint8)
-            
-            padded_image = self.add_white_padding(scaled_image, padding_size=padding_size)
+    def generateOQR(self, name, type, error, values, defaultMask=-1, padding_size=50):     
+        qrs_image = []
+        qrs_binary = self.generateLayers(name, error, values)
+
+        scale = self.scales.get(type)
+        
+        if scale is not None:
+            # Compose the image straight into a white padded uint8 canvas
+            size = len(qrs_binary[0]) * scale
+            padded_image = self.white_canvas(size, size, padding_size)
+            self.compose(type, qrs_binary, padded_image[padding_size:padding_size+size, padding_size:padding_size+size])
             
             qrs_image.append(padded_image)
             return qrs_image
         
-        return None
\ No newline at end of file
+        return None
+    
+    def generateOQRBands(self, name, type, error, values, padding_size=50):
+        """
+        Generate an OQR as horizontal bands of pixel rows rather than one image, so
+        that only one module row is rasterized in memory at a time
+        
+        Returns:
+            ((height, width), bands) where bands yields the padded grayscale image
+            top to bottom: the top padding, one band of scale rows per module row,
+            then the bottom padding. Band buffers are reused, consume each band
+            before asking for the next. None for an invalid type
+        """
+        if type not in self.scales:
+            return None
+        
+        return self.composeBands(type, self.generateLayers(name, error, values), padding_size)
+    
+    def composeBands(self, type, qrs_binary, padding_size=50):
+        """
+        Compose already encoded layers (as returned by generateLayers) into bands,
+        see generateOQRBands
+        
+        Returns:
+            ((height, width), bands)
+        """
+        scale = self.scales[type]
+        qrs_binary = [np.asarray(qr, dtype=np.uint8) for qr in qrs_binary]
+        size = len(qrs_binary[0]) * scale
+        width = size + 2*padding_size
+        
+        def bands():
+            if padding_size:
+                yield np.full((padding_size, width), 255, dtype=np.uint8)
+            
+            band = np.full((scale, width), 255, dtype=np.uint8)
+            for row in range(len(qrs_binary[0])):
+                self.compose(type, [qr[row:row+1] for qr in qrs_binary], band[:, padding_size:padding_size+size])
+                yield band
+            
+            if padding_size:
+                yield np.full((padding_size, width), 255, dtype=np.uint8)
+        
+        return (width, width), bands()
+    
+    def generateOQRCells(self, type, qrs_binary, padding_size=50):
+        """
+        Compose already encoded layers (as returned by generateLayers) at cell
+        resolution, one element per cell_size x cell_size block of the padded
+        image generateOQR would produce
+        
+        Returns:
+            (cells, cell_size), or None for an invalid type
+        """
+        if type not in self.scales:
+            return None
+        
+        cell_size = math.gcd(self.cell_sizes[type], padding_size)
+        _, bands = self.composeBands(type, qrs_binary, padding_size)
+        cells = np.vstack([band[::cell_size, ::cell_size].copy() for band in bands])
+        return cells, cell_size
+    
+    def generateOQRVector(self, type, qrs_binary, path, padding_size=50):
+        """
+        Write already encoded layers (as returned by generateLayers) composed
+        straight to a vector file, SVG or PDF depending on the extension of
+        path, with one path per color instead of per pixel block
+        
+        Returns:
+            path, or None for an invalid type
+        """
+        result = self.generateOQRCells(type, qrs_binary, padding_size)
+        if result is None:
+            return None
+        
+        cells, cell_size = result
+        if os.path.splitext(path)[1].lower() == ".pdf":
+            self.image_modifier.matrixToPDF(cells, path, cell_size)
+        else:
+            self.image_modifier.matrixToSVG(cells, path, cell_size)
+        return path
+    
+    def generate_batch(self, jobs, workers=None, chunk_size=4, ordered=True):
+        """
+        Generate many OQRs across a pool of worker processes
+        
+        Args:
+            jobs: Iterable of (name, type, error, values) tuples, as passed to generateOQR
+            workers: Number of worker processes (default: number of CPUs)
+            chunk_size: Number of jobs handed to a worker at a time (default: 4)
+            ordered: Yield results in job order, or as soon as they finish (default: True)
+        
+        Yields:
+            (name, result) tuples, result being what generateOQR returns (None on failure)
+        """
+        jobs = iter(jobs)
+        workers = workers or os.cpu_count() or 1
+        # Only keep a couple of chunks per worker queued, so that neither the
+        # jobs nor the finished images pile up in memory
+        max_pending = workers * 2
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            exhausted = False
+            
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    chunk = list(islice(jobs, chunk_size))
+                    if chunk:
+                        pending.append(executor.submit(_generate_chunk, chunk))
+                    else:
+                        exhausted = True
+                
+                if not pending:
+                    break
+                
+                if ordered:
+                    yield from pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield from future.result()
+
+
+def _generate_chunk(jobs):
+    oqr_generator = OQR_Generator()
+    results = []
+    for name, type, error, values in jobs:
+        try:
+            results.append((name, oqr_generator.generateOQR(name, type, error, values)))
+        except Exception as e:
+            print(f"✗ Failed to generate OQR {name}: {e}")
+            results.append((name, None))
+    return results
@@ -3,8 +3,9 @@ import cv2
 import csv
 import random
 import numpy as np
+from bisect import bisect_left
 
-from Processing.qrcode import constants, main
+from Processing.qrcode import constants, main, util
 
 class QR_Helper:
     def __init__(self):
@@ -12,26 +13,71 @@ class QR_Helper:
     
     def generateTraditionalQR(self, value, version, error, mask=-1, borderSize = 0):
         if mask!=-1:
-            qr = main.QRCode(version = version, error_correction=error, border = borderSize, mask_pattern = mask)
+            qr = main.QRCode(version = version, error_correction=error, border = borderSize, mask_pattern = mask, array_backed = True)
         else:
-            qr = main.QRCode(version = version, error_correction=error, border = borderSize)
+            qr = main.QRCode(version = version, error_correction=error, border = borderSize, array_backed = True)
         qr.add_data(value)
         return qr
     
+    def fitQRVersion(self, value, error):
+        """
+        Smallest version that holds value, worked out from the bit capacity
+        table without building the code. 41 if it does not fit in any version
+        """
+        qr = main.QRCode(error_correction=error)
+        qr.add_data(value)
+        
+        # As QRCode.best_fit, without setting a version past 40: the length
+        # fields grow with the version, so refit from the version found until
+        # their sizes stop changing
+        start = 1
+        while True:
+            mode_sizes = util.mode_sizes_for_version(start)
+            buffer = util.BitBuffer()
+            for data in qr.data_list:
+                buffer.put(data.mode, 4)
+                buffer.put(len(data), mode_sizes[data.mode])
+                data.write(buffer)
+            version = bisect_left(util.BIT_LIMIT_TABLE[error], len(buffer), start)
+            if version > 40 or mode_sizes is util.mode_sizes_for_version(version):
+                return version
+            start = version
+    
     def determineQRVersion(self, qr):
-        return (len(qr.get_matrix())-17)//4
+        return (len(qr.get_matrix_array())-17)//4
+    
+    def to_array(self, qr):
+        """
+        Module matrix of a code as a uint8 array, 1 for dark modules. Shares
+        memory with the code, which should not be changed afterwards
+        """
+        return qr.get_matrix_array()
     
     def convertQRToBinary(self, qr):
-        mat = np.array(qr.get_matrix())
-        mat = mat*1
-        mat = [''.join(map(str, mat[i].tolist())) for i in range(mat.shape[0])]
-        mat = [list(map(int,list(x))) for x in mat]
-        return mat
+        return self.to_array(qr).tolist()
+    
+    def render(self, qr_binary, scale=1, channels=3):
+        """
+        Draw a module matrix as an image, dark modules black and light ones white
+        
+        Args:
+            qr_binary: Module matrix (array or nested lists, 1 for dark modules)
+            scale: Pixels per module side
+            channels: Color channels, 1 for a 2D grayscale image
+        
+        Returns:
+            uint8 array of (rows*scale, cols*scale[, channels]) pixels
+        """
+        light = (1 - np.asarray(qr_binary, dtype=np.uint8)) * np.uint8(255)
+        rows, cols = light.shape
+        channel_shape = (channels,) if channels > 1 else ()
+        
+        # Each module broadcast over its scale x scale block (and the channels)
+        # of a (rows, scale, cols, scale) image, which is the pixel layout
+        img = np.empty((rows*scale, cols*scale) + channel_shape, dtype=np.uint8)
+        blocks = img.reshape((rows, scale, cols, scale) + channel_shape)
+        blocks[...] = light.reshape((rows, 1, cols, 1) + (1,)*len(channel_shape))
+        return img
     
     def generateQRImage(self, qr_text):
-        img = np.zeros([len(qr_text), len(qr_text[0]), 3],dtype=np.uint8)
-        for i in range(len(qr_text)):
-            for j in range(len(qr_text[0])):
-                    if qr_text[i][j] == 0:
-                        img[i][j] = [255, 255, 255]
-        return img
\ No newline at end of file
+        return self.render(qr_text)
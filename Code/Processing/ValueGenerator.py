@@ -18,27 +18,3 @@ class ValueGenerator:
     
     def randomString(self, x):
         return ''.join(random.choices(string.ascii_letters, k = x))
-    
-    def provideString(self, s1, s2, version, ecc): # Modify String s2 corresponding to String s1
-        q1 = main.QRCode(version = version, error_correction=self.errorCorrection[ecc], border = 0, mask_pattern = 0)
-        q1.add_data(s1)
-
-        curLength = len(s2)
-        maxLength = self.maxSize[ecc][version-1]-len(s2)
-        
-        lowestV = 10000
-        lowestS = ""
-        t=0
-        while(t<100):
-            t+=1
-            temp = self.randomString(random.randint(1,maxLength))
-            temp_s2 = s2 + temp
-            q2 = main.QRCode(version = version, error_correction=self.errorCorrection[ecc], border = 0, mask_pattern = 0)
-            q2.add_data(temp_s2)
-            nonSim = self.qrSize[version-1] - (np.sum((np.array(q1.get_matrix()) == np.array(q2.get_matrix()))))
-
-            if nonSim<lowestV:
-                lowestS = temp_s2
-                lowestV = nonSim
-                
-        return lowestS
\ No newline at end of file
@@ -1,5 +1,8 @@
-from typing import NamedTuple
-from . import constants
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from . import LUT, constants
 
 EXP_TABLE = list(range(256))
 
@@ -16,6 +19,9 @@ for i in range(8, 256):
 for i in range(255):
     LOG_TABLE[EXP_TABLE[i]] = i
 
+# EXP_TABLE repeated so that the sum of two logs can index it without a modulo
+EXP_TABLE_2X = EXP_TABLE[:255] * 2
+
 RS_BLOCK_OFFSET = {
     constants.ERROR_CORRECT_L: 0,
     constants.ERROR_CORRECT_M: 1,
@@ -272,21 +278,101 @@ class Polynomial:
         return Polynomial(num, 0)
 
     def __mod__(self, other):
-        difference = len(self) - len(other)
-        if difference < 0:
-            return self
-
-        ratio = glog(self[0]) - glog(other[0])
-
-        num = [
-            item ^ gexp(glog(other_item) + ratio)
-            for item, other_item in zip(self, other)
+        result = self
+        while len(result) >= len(other):
+            difference = len(result) - len(other)
+            ratio = glog(result[0]) - glog(other[0])
+
+            num = [
+                item ^ gexp(glog(other_item) + ratio)
+                for item, other_item in zip(result, other)
+            ]
+            if difference:
+                num.extend(result[-difference:])
+
+            result = Polynomial(num, 0)
+        return result
+
+
+# Generator polynomials missing from LUT.rsPoly_LUT, computed on first use
+rs_generator_cache: Dict[int, List[int]] = {}
+# Logs of the generator coefficients (leading 1 excluded) for rs_encode
+rs_generator_log_cache: Dict[int, List[int]] = {}
+# Products of every byte with the generator coefficients for rs_encode_batch
+rs_product_cache: Dict[int, np.ndarray] = {}
+
+
+def rs_generator(ec_count):
+    """
+    Return the coefficients of the Reed-Solomon generator polynomial for
+    ``ec_count`` error correction codewords, highest degree first.
+    """
+    if ec_count in LUT.rsPoly_LUT:
+        return LUT.rsPoly_LUT[ec_count]
+    if ec_count not in rs_generator_cache:
+        generator = Polynomial([1], 0)
+        for i in range(ec_count):
+            generator = generator * Polynomial([1, gexp(i)], 0)
+        rs_generator_cache[ec_count] = generator.num
+    return rs_generator_cache[ec_count]
+
+
+def rs_encode(data, ec_count):
+    """
+    Return the ``ec_count`` error correction codewords for a block of data
+    codewords.
+
+    Divides by the generator polynomial one codeword at a time, as a linear
+    feedback shift register would, using the log/antilog tables.
+    """
+    if ec_count not in rs_generator_log_cache:
+        rs_generator_log_cache[ec_count] = [
+            LOG_TABLE[coefficient] for coefficient in rs_generator(ec_count)[1:]
         ]
-        if difference:
-            num.extend(self[-difference:])
-
-        # recursive call
-        return Polynomial(num, 0) % other
+    generator_log = rs_generator_log_cache[ec_count]
+
+    remainder = [0] * ec_count
+    for item in data:
+        factor = item ^ remainder[0]
+        remainder = remainder[1:] + [0]
+        if factor:
+            factor_log = LOG_TABLE[factor]
+            remainder = [
+                r ^ EXP_TABLE_2X[factor_log + g]
+                for r, g in zip(remainder, generator_log)
+            ]
+    return remainder
+
+
+def rs_encode_batch(data, ec_count):
+    """
+    Reed-Solomon encode many blocks at once.
+
+    :param data: uint8 array of shape ``(blocks, data_count)``. Shorter blocks
+        can be left padded with zeros, which doesn't change their error
+        correction codewords.
+    :return: uint8 array of shape ``(blocks, ec_count)``.
+    """
+    if ec_count not in rs_product_cache:
+        logs = np.array(LOG_TABLE, dtype=np.intp)
+        generator = np.array(rs_generator(ec_count)[1:], dtype=np.intp)
+        products = np.array(EXP_TABLE_2X, dtype=np.uint8)[
+            logs[1:, np.newaxis] + logs[generator]
+        ]
+        # Multiplying by 0 always gives 0.
+        rs_product_cache[ec_count] = np.vstack(
+            [np.zeros((1, ec_count), dtype=np.uint8), products]
+        )
+    products = rs_product_cache[ec_count]
+
+    data = np.asarray(data, dtype=np.uint8)
+    remainder = np.zeros((data.shape[0], ec_count), dtype=np.uint8)
+    for column in data.T:
+        factor = column ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        remainder ^= products[factor]
+    return remainder
 
 
 class RSBlock(NamedTuple):
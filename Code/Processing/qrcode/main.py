@@ -6,12 +6,15 @@ from typing import (
     List,
     NamedTuple,
     Optional,
+    Tuple,
     Type,
     TypeVar,
+    Union,
     cast,
     overload,
 )
 
+import numpy as np
 from typing_extensions import Literal
 from . import constants, exceptions, util
 from .image.base import BaseImage
@@ -20,6 +23,12 @@ from .image.pure import PyPNGImage
 ModulesType = List[List[Optional[bool]]]
 # Cache modules generated just based on the QR Code version
 precomputed_qr_blanks: Dict[int, ModulesType] = {}
+# The same blanks as uint8 arrays (empty modules are 0), for array backed codes
+precomputed_array_blanks: Dict[int, np.ndarray] = {}
+# Cache the (rows, cols) of the data modules in placement order, and the 8
+# mask patterns as (8, N, N) boolean arrays, also keyed by version
+precomputed_data_placements: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+precomputed_mask_patterns: Dict[int, np.ndarray] = {}
 
 
 def make(data=None, **kwargs):
@@ -55,6 +64,53 @@ def copy_2d_array(x):
     return [row[:] for row in x]
 
 
+def data_placement(modules):
+    """
+    Return the (rows, cols) index arrays of the still empty (``None``) modules
+    in the zig-zag order data bits get placed in.
+    """
+    modules_count = len(modules)
+    rows: List[int] = []
+    cols: List[int] = []
+    inc = -1
+    row = modules_count - 1
+
+    for col in range(modules_count - 1, 0, -2):
+
+        if col <= 6:
+            col -= 1
+
+        col_range = (col, col - 1)
+
+        while True:
+
+            for c in col_range:
+
+                if modules[row][c] is None:
+                    rows.append(row)
+                    cols.append(c)
+
+            row += inc
+
+            if row < 0 or modules_count <= row:
+                row -= inc
+                inc = -inc
+                break
+
+    return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+
+def data_bits(data, count):
+    """
+    Unpack codewords into ``count`` booleans, most significant bit first,
+    padding the remainder bits with ``False``.
+    """
+    bits = np.zeros(count, dtype=bool)
+    unpacked = np.unpackbits(np.array(data, dtype=np.uint8))[:count]
+    bits[: len(unpacked)] = unpacked
+    return bits
+
+
 class ActiveWithNeighbors(NamedTuple):
     NW: bool
     N: bool
@@ -75,7 +131,7 @@ GenericImageLocal = TypeVar("GenericImageLocal", bound=BaseImage)
 
 
 class QRCode(Generic[GenericImage]):
-    modules: ModulesType
+    modules: Union[ModulesType, np.ndarray]
     _version: Optional[int] = None
 
     def __init__(
@@ -86,7 +142,13 @@ class QRCode(Generic[GenericImage]):
         border=4,
         image_factory: Optional[Type[GenericImage]] = None,
         mask_pattern=None,
+        array_backed=False,
     ):
+        """
+        :param array_backed: Store the modules as a uint8 NumPy array of 0s
+            and 1s rather than a list of lists of booleans. Use
+            ``get_matrix_array`` to read the matrix without copying it.
+        """
         _check_box_size(box_size)
         _check_border(border)
         self.version = version
@@ -97,6 +159,7 @@ class QRCode(Generic[GenericImage]):
         self.border = int(border)
         self.mask_pattern = mask_pattern
         self.image_factory = image_factory
+        self.array_backed = array_backed
         self.penalty_scores = []
         self.final_mask = None
         if image_factory is not None:
@@ -169,19 +232,13 @@ class QRCode(Generic[GenericImage]):
             self.final_mask = mask_pattern
         self.modules_count = self.version * 4 + 17
 
-        if self.version in precomputed_qr_blanks:
-            self.modules = copy_2d_array(precomputed_qr_blanks[self.version])
-        else:
-            self.modules = [
-                [None] * self.modules_count for i in range(self.modules_count)
-            ]
-            self.setup_position_probe_pattern(0, 0)
-            self.setup_position_probe_pattern(self.modules_count - 7, 0)
-            self.setup_position_probe_pattern(0, self.modules_count - 7)
-            self.setup_position_adjust_pattern()
-            self.setup_timing_pattern()
+        if self.version not in precomputed_qr_blanks:
+            self.setup_blank()
 
-            precomputed_qr_blanks[self.version] = copy_2d_array(self.modules)
+        if self.array_backed:
+            self.modules = precomputed_array_blanks[self.version].copy()
+        else:
+            self.modules = copy_2d_array(precomputed_qr_blanks[self.version])
 
         self.setup_type_info(test, mask_pattern)
 
@@ -194,6 +251,32 @@ class QRCode(Generic[GenericImage]):
             )
         self.map_data(self.data_cache, mask_pattern)
 
+    def setup_blank(self):
+        """
+        Build and cache the function patterns for the current version, along
+        with the placement of its data modules.
+        """
+        self.modules = [
+            [None] * self.modules_count for i in range(self.modules_count)
+        ]
+        self.setup_position_probe_pattern(0, 0)
+        self.setup_position_probe_pattern(self.modules_count - 7, 0)
+        self.setup_position_probe_pattern(0, self.modules_count - 7)
+        self.setup_position_adjust_pattern()
+        self.setup_timing_pattern()
+
+        precomputed_qr_blanks[self.version] = copy_2d_array(self.modules)
+        precomputed_array_blanks[self.version] = np.array(
+            self.modules, dtype=bool
+        ).astype(np.uint8)
+
+        # Reserve the format (and version) information, everything still
+        # empty after that holds data.
+        self.setup_type_info(True, 0)
+        if self.version >= 7:
+            self.setup_type_number(True)
+        precomputed_data_placements[self.version] = data_placement(self.modules)
+
     def setup_position_probe_pattern(self, row, col):
         for r in range(-1, 8):
 
@@ -248,19 +331,20 @@ class QRCode(Generic[GenericImage]):
         """
         Find the most efficient mask pattern.
         """
-        min_lost_point = 0
-        pattern = 0
+        # All 8 trials share the blank (test mode type info is all light), so
+        # build it once and only vary the masked data modules.
+        self.makeImpl(True, 0)
+        rows, cols = self.data_placement()
+        masks = self.mask_patterns()[:, rows, cols]
 
-        for i in range(8):
-            self.makeImpl(True, i)
+        trials = np.repeat(np.array(self.modules, dtype=bool)[np.newaxis], 8, axis=0)
+        trials[:, rows, cols] = data_bits(self.data_cache, len(rows)) ^ masks
 
-            lost_point = util.lost_point(self.modules)
-            self.penalty_scores.append(lost_point)
-            if i == 0 or min_lost_point > lost_point:
-                min_lost_point = lost_point
-                pattern = i
+        lost_points = util.lost_points(trials).tolist()
+        self.penalty_scores.extend(lost_points)
 
-        return pattern
+        # First pattern with the lowest penalty wins.
+        return lost_points.index(min(lost_points))
 
     def print_tty(self, out=None):
         """
@@ -476,50 +560,40 @@ class QRCode(Generic[GenericImage]):
         # fixed module
         self.modules[self.modules_count - 8][8] = not test
 
-    def map_data(self, data, mask_pattern):
-        inc = -1
-        row = self.modules_count - 1
-        bitIndex = 7
-        byteIndex = 0
-
-        mask_func = util.mask_func(mask_pattern)
-
-        data_len = len(data)
-
-        for col in range(self.modules_count - 1, 0, -2):
-
-            if col <= 6:
-                col -= 1
-
-            col_range = (col, col - 1)
-
-            while True:
-
-                for c in col_range:
-
-                    if self.modules[row][c] is None:
-
-                        dark = False
-
-                        if byteIndex < data_len:
-                            dark = ((data[byteIndex] >> bitIndex) & 1) == 1
-
-                        if mask_func(row, c):
-                            dark = not dark
-
-                        self.modules[row][c] = dark
-                        bitIndex -= 1
+    def data_placement(self):
+        """
+        Return the cached (rows, cols) of the data modules for this version.
+        """
+        if self.version not in precomputed_data_placements:
+            modules = self.modules
+            self.modules_count = self.version * 4 + 17
+            self.setup_blank()
+            self.modules = modules
+        return precomputed_data_placements[self.version]
+
+    def mask_patterns(self):
+        """
+        Return the cached (8, N, N) boolean arrays of all mask patterns.
+        """
+        if self.version not in precomputed_mask_patterns:
+            modules_count = self.version * 4 + 17
+            precomputed_mask_patterns[self.version] = np.array(
+                [util.mask_array(i, modules_count) for i in range(8)]
+            )
+        return precomputed_mask_patterns[self.version]
 
-                        if bitIndex == -1:
-                            byteIndex += 1
-                            bitIndex = 7
+    def map_data(self, data, mask_pattern):
+        rows, cols = self.data_placement()
+        dark = data_bits(data, len(rows))
+        dark ^= self.mask_patterns()[mask_pattern, rows, cols]
 
-                row += inc
+        if self.array_backed:
+            self.modules[rows, cols] = dark
+            return
 
-                if row < 0 or self.modules_count <= row:
-                    row -= inc
-                    inc = -inc
-                    break
+        modules = np.array(self.modules, dtype=bool)
+        modules[rows, cols] = dark
+        self.modules = modules.tolist()
 
     def get_matrix(self):
         """
@@ -530,6 +604,9 @@ class QRCode(Generic[GenericImage]):
         if self.data_cache is None:
             self.make()
 
+        if self.array_backed:
+            return self.get_matrix_array().astype(bool).tolist()
+
         if not self.border:
             return self.modules
 
@@ -542,6 +619,30 @@ class QRCode(Generic[GenericImage]):
 
         return code
 
+    def get_matrix_array(self, border=None):
+        """
+        Return the QR Code as a uint8 array of 0s (light) and 1s (dark),
+        including a border of ``border`` modules (``self.border`` by default).
+
+        For array backed codes without a border, this is the module array
+        itself rather than a copy.
+        """
+        if self.data_cache is None:
+            self.make()
+
+        if border is None:
+            border = self.border
+        _check_border(border)
+
+        if self.array_backed:
+            modules = self.modules
+        else:
+            modules = np.array(self.modules, dtype=np.uint8)
+
+        if not border:
+            return modules
+        return np.pad(modules, border)
+
     def active_with_neighbors(self, row: int, col: int) -> ActiveWithNeighbors:
         context: List[bool] = []
         for r in range(row - 1, row + 2):
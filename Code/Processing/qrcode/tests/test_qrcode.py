@@ -5,6 +5,7 @@ import warnings
 from tempfile import mkdtemp
 from unittest import mock
 
+import numpy as np
 import png
 
 import qrcode
@@ -472,6 +473,62 @@ class QRCodeTests(unittest.TestCase):
         matrix = [row[1:-1] for row in qr.get_matrix()[1:-1]]
         self.assertEqual(matrix, qr.modules)
 
+    def test_get_matrix_array(self):
+        qr = qrcode.QRCode(border=0)
+        qr.add_data("1")
+        matrix = qr.get_matrix_array()
+        self.assertEqual(matrix.dtype, np.uint8)
+        self.assertEqual(matrix.astype(bool).tolist(), qr.modules)
+
+        bordered = qr.get_matrix_array(border=2)
+        self.assertEqual(bordered.shape, (25, 25))
+        self.assertFalse(bordered[:2].any() or bordered[:, -2:].any())
+        self.assertTrue((bordered[2:-2, 2:-2] == matrix).all())
+
+    def test_array_backed(self):
+        qr = qrcode.QRCode(border=1)
+        qr.add_data("array backed")
+        array_qr = qrcode.QRCode(border=1, array_backed=True)
+        array_qr.add_data("array backed")
+
+        self.assertIsInstance(array_qr.get_matrix_array(), np.ndarray)
+        self.assertEqual(array_qr.get_matrix(), qr.get_matrix())
+        self.assertEqual(array_qr.get_mask(), qr.get_mask())
+        self.assertEqual(array_qr.penalty_scores, qr.penalty_scores)
+        # No copy when asking for the matrix without a border.
+        self.assertIs(array_qr.get_matrix_array(border=0), array_qr.modules)
+
+    @unittest.skipIf(not pil_Image, "Requires PIL")
+    def test_array_backed_image(self):
+        qr = qrcode.QRCode(array_backed=True)
+        qr.add_data("a")
+        img = qr.make_image()
+        img.save(io.BytesIO())
+
+    def test_data_placement(self):
+        qr = qrcode.QRCode(version=7, border=0)
+        qr.add_data("placement")
+        qr.make(fit=False)
+        rows, cols = qr.data_placement()
+        # 196 codewords plus 0 remainder bits for version 7.
+        self.assertEqual(len(rows), 196 * 8)
+        self.assertEqual(len(set(zip(rows.tolist(), cols.tolist()))), len(rows))
+        # Placement starts in the bottom right corner, going up.
+        self.assertEqual(
+            list(zip(rows[:4].tolist(), cols[:4].tolist())),
+            [(44, 44), (44, 43), (43, 44), (43, 43)],
+        )
+        self.assertIs(qr.data_placement(), qrcode.main.precomputed_data_placements[7])
+
+    def test_mask_patterns(self):
+        qr = qrcode.QRCode(version=2)
+        masks = qr.mask_patterns()
+        self.assertEqual(masks.shape, (8, 25, 25))
+        for pattern in range(8):
+            mask_func = qrcode.util.mask_func(pattern)
+            for row, col in [(0, 0), (3, 7), (11, 4), (24, 23)]:
+                self.assertEqual(masks[pattern, row, col], mask_func(row, col))
+
     def test_negative_size_at_construction(self):
         self.assertRaises(ValueError, qrcode.QRCode, box_size=-1)
 
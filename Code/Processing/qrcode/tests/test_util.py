@@ -1,6 +1,9 @@
 import unittest
 
-from qrcode import util
+import numpy as np
+
+import qrcode
+from qrcode import base, util
 
 
 class UtilTests(unittest.TestCase):
@@ -10,3 +13,63 @@ class UtilTests(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             util.check_version(41)
+
+    def test_lost_points_batch_matches_single(self):
+        rng = np.random.default_rng(0)
+        matrices = rng.random((8, 25, 25)) < 0.5
+        batch = util.lost_points(matrices).tolist()
+        self.assertEqual(batch, [util.lost_point(m.tolist()) for m in matrices])
+
+    def test_lost_point_levels(self):
+        # A solid light matrix: 2 * 21 runs of 21, every 2x2 block uniform,
+        # no finder-like patterns and 50% away from the ideal dark ratio.
+        blank = [[False] * 21 for _ in range(21)]
+        self.assertEqual(util.lost_point(blank), 42 * 19 + 400 * 3 + 100)
+
+        # Finder-like 10111010000 windows, both along rows and columns.
+        row = [int(bit) for bit in "10111010000"] * 2
+        matrix = np.array([row] * 22, dtype=bool)
+        self.assertEqual(
+            util.lost_points(matrix[np.newaxis])[0], util.lost_point(matrix)
+        )
+
+    def test_penalty_scores(self):
+        qr = qrcode.QRCode(border=0)
+        qr.add_data("http://www.lincolnloop.com")
+        qr.make()
+        self.assertEqual(qr.penalty_scores, [798, 762, 550, 1041, 733, 567, 619, 998])
+        self.assertEqual(qr.get_mask(), 2)
+
+        qr = qrcode.QRCode(error_correction=qrcode.ERROR_CORRECT_H, border=0)
+        qr.add_data("OQR" * 40)
+        qr.make()
+        self.assertEqual(qr.version, 8)
+        self.assertEqual(
+            qr.penalty_scores, [2136, 2045, 2243, 2386, 2251, 2122, 2231, 2374]
+        )
+        self.assertEqual(qr.get_mask(), 1)
+
+    def test_rs_encode(self):
+        # "HELLO WORLD" as a 1-M code.
+        data = [32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17, 236, 17, 236, 17]
+        ec = [196, 35, 39, 119, 235, 215, 231, 226, 93, 23]
+        self.assertEqual(base.rs_encode(data, 10), ec)
+        self.assertEqual(base.rs_encode_batch([data], 10).tolist(), [ec])
+
+    def test_rs_encode_matches_polynomial(self):
+        rng = np.random.default_rng(0)
+        # 5 isn't in LUT.rsPoly_LUT, so the generator gets computed.
+        for ec_count in (5, 7, 18, 30):
+            generator = base.Polynomial(base.rs_generator(ec_count), 0)
+            blocks = rng.integers(1, 256, size=(4, 20), dtype=np.uint8)
+            expected = []
+            for block in blocks.tolist():
+                remainder = base.Polynomial(block, ec_count) % generator
+                expected.append([0] * (ec_count - len(remainder)) + remainder.num)
+                self.assertEqual(base.rs_encode(block, ec_count), expected[-1])
+            self.assertEqual(base.rs_encode_batch(blocks, ec_count).tolist(), expected)
+
+    def test_rs_encode_batch_left_padding(self):
+        short, long = [64, 17, 236], [3, 99, 64, 17, 236]
+        encoded = base.rs_encode_batch([[0, 0] + short, long], 7).tolist()
+        self.assertEqual(encoded, [base.rs_encode(short, 7), base.rs_encode(long, 7)])
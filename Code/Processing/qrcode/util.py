@@ -2,7 +2,9 @@ import math
 import re
 from typing import List
 
-from . import LUT, base, exceptions
+import numpy as np
+
+from . import base, exceptions
 from .base import RSBlock
 
 # QR encoding modes.
@@ -142,6 +144,9 @@ def pattern_position(version):
 def mask_func(pattern):
     """
     Return the mask function for the given mask pattern.
+
+    The functions work both on single ``(row, col)`` coordinates and on
+    integer coordinate arrays (see ``mask_array``).
     """
     if pattern == 0:  # 000
         return lambda i, j: (i + j) % 2 == 0
@@ -152,7 +157,7 @@ def mask_func(pattern):
     if pattern == 3:  # 011
         return lambda i, j: (i + j) % 3 == 0
     if pattern == 4:  # 100
-        return lambda i, j: (math.floor(i / 2) + math.floor(j / 3)) % 2 == 0
+        return lambda i, j: (i // 2 + j // 3) % 2 == 0
     if pattern == 5:  # 101
         return lambda i, j: (i * j) % 2 + (i * j) % 3 == 0
     if pattern == 6:  # 110
@@ -162,6 +167,15 @@ def mask_func(pattern):
     raise TypeError("Bad mask pattern: " + pattern)  # pragma: no cover
 
 
+def mask_array(pattern, modules_count):
+    """
+    Return the given mask pattern as a boolean array covering the whole
+    ``modules_count`` x ``modules_count`` matrix.
+    """
+    rows, cols = np.indices((modules_count, modules_count))
+    return mask_func(pattern)(rows, cols)
+
+
 def mode_sizes_for_version(version):
     if version < 10:
         return MODE_SIZE_SMALL
@@ -186,170 +200,104 @@ def check_version(version):
 
 
 def lost_point(modules):
-    modules_count = len(modules)
+    """
+    Return the penalty score of a single module matrix.
+
+    ``modules`` may be a list of lists of booleans or a 2D array.
+    """
+    return int(lost_points(np.asarray(modules, dtype=bool)[np.newaxis])[0])
 
-    lost_point = 0
 
-    lost_point = _lost_point_level1(modules, modules_count)
-    lost_point += _lost_point_level2(modules, modules_count)
-    lost_point += _lost_point_level3(modules, modules_count)
-    lost_point += _lost_point_level4(modules, modules_count)
+def lost_points(matrices):
+    """
+    Return the penalty scores of a batch of module matrices.
+
+    :param matrices: boolean array of shape ``(k, N, N)``, e.g. the 8 mask
+        trials of a single QR Code.
+    :return: integer array of ``k`` penalty scores.
+    """
+    matrices = np.asarray(matrices, dtype=bool)
+    modules_count = matrices.shape[-1]
+
+    lost_point = _lost_point_level1(matrices, modules_count)
+    lost_point += _lost_point_level2(matrices, modules_count)
+    lost_point += _lost_point_level3(matrices, modules_count)
+    lost_point += _lost_point_level4(matrices, modules_count)
 
     return lost_point
 
 
-def _lost_point_level1(modules, modules_count):
-    lost_point = 0
-
-    modules_range = range(modules_count)
-    container = [0] * (modules_count + 1)
-
-    for row in modules_range:
-        this_row = modules[row]
-        previous_color = this_row[0]
-        length = 0
-        for col in modules_range:
-            if this_row[col] == previous_color:
-                length += 1
-            else:
-                if length >= 5:
-                    container[length] += 1
-                length = 1
-                previous_color = this_row[col]
-        if length >= 5:
-            container[length] += 1
-
-    for col in modules_range:
-        previous_color = modules[0][col]
-        length = 0
-        for row in modules_range:
-            if modules[row][col] == previous_color:
-                length += 1
-            else:
-                if length >= 5:
-                    container[length] += 1
-                length = 1
-                previous_color = modules[row][col]
-        if length >= 5:
-            container[length] += 1
-
-    lost_point += sum(
-        container[each_length] * (each_length - 2)
-        for each_length in range(5, modules_count + 1)
+def _run_penalties(matrices, modules_count):
+    # Lay every row out on a (N + 1)-wide grid so that each row gets a run
+    # boundary at both ends, then measure runs as the distance between
+    # consecutive boundaries. Runs shorter than 5 (including the single
+    # cell "run" between the end of one row and the start of the next)
+    # score nothing.
+    batch = matrices.shape[0]
+    rows = matrices.reshape(-1, modules_count)
+    boundaries = np.ones((rows.shape[0], modules_count + 1), dtype=bool)
+    np.not_equal(rows[:, 1:], rows[:, :-1], out=boundaries[:, 1:-1])
+    positions = np.flatnonzero(boundaries)
+
+    lengths = np.diff(positions)
+    owners = positions[:-1] // (modules_count * (modules_count + 1))
+    scores = np.where(lengths >= 5, lengths - 2, 0)
+
+    return np.bincount(owners, weights=scores, minlength=batch).astype(np.int64)
+
+
+def _lost_point_level1(matrices, modules_count):
+    return _run_penalties(matrices, modules_count) + _run_penalties(
+        matrices.transpose(0, 2, 1), modules_count
     )
 
-    return lost_point
 
+def _lost_point_level2(matrices, modules_count):
+    top_left = matrices[:, :-1, :-1]
+    blocks = (
+        (top_left == matrices[:, :-1, 1:])
+        & (top_left == matrices[:, 1:, :-1])
+        & (top_left == matrices[:, 1:, 1:])
+    )
+    return blocks.sum(axis=(1, 2), dtype=np.int64) * 3
 
-def _lost_point_level2(modules, modules_count):
-    lost_point = 0
-
-    modules_range = range(modules_count - 1)
-    for row in modules_range:
-        this_row = modules[row]
-        next_row = modules[row + 1]
-        # use iter() and next() to skip next four-block. e.g.
-        # d a f   if top-right a != b bottom-right,
-        # c b e   then both abcd and abef won't lost any point.
-        modules_range_iter = iter(modules_range)
-        for col in modules_range_iter:
-            top_right = this_row[col + 1]
-            if top_right != next_row[col + 1]:
-                # reduce 33.3% of runtime via next().
-                # None: raise nothing if there is no next item.
-                next(modules_range_iter, None)
-            elif top_right != this_row[col]:
-                continue
-            elif top_right != next_row[col]:
-                continue
-            else:
-                lost_point += 3
 
-    return lost_point
+# 1 : 1 : 3 : 1 : 1 ratio (dark:light:dark:light:dark) pattern in
+# row/column, preceded or followed by light area 4 modules wide. From ISOIEC.
+# pattern1:     10111010000
+# pattern2: 00001011101
+LEVEL3_PATTERN_1 = 0b10111010000
+LEVEL3_PATTERN_2 = 0b00001011101
 
 
-def _lost_point_level3(modules, modules_count):
-    # 1 : 1 : 3 : 1 : 1 ratio (dark:light:dark:light:dark) pattern in
-    # row/column, preceded or followed by light area 4 modules wide. From ISOIEC.
-    # pattern1:     10111010000
-    # pattern2: 00001011101
-    modules_range = range(modules_count)
-    modules_range_short = range(modules_count - 10)
-    lost_point = 0
-
-    for row in modules_range:
-        this_row = modules[row]
-        modules_range_short_iter = iter(modules_range_short)
-        col = 0
-        for col in modules_range_short_iter:
-            if (
-                not this_row[col + 1]
-                and this_row[col + 4]
-                and not this_row[col + 5]
-                and this_row[col + 6]
-                and not this_row[col + 9]
-                and (
-                    this_row[col + 0]
-                    and this_row[col + 2]
-                    and this_row[col + 3]
-                    and not this_row[col + 7]
-                    and not this_row[col + 8]
-                    and not this_row[col + 10]
-                    or not this_row[col + 0]
-                    and not this_row[col + 2]
-                    and not this_row[col + 3]
-                    and this_row[col + 7]
-                    and this_row[col + 8]
-                    and this_row[col + 10]
-                )
-            ):
-                lost_point += 40
-            # horspool algorithm.
-            # if this_row[col + 10]:
-            #   pattern1 shift 4, pattern2 shift 2. So min=2.
-            # else:
-            #   pattern1 shift 1, pattern2 shift 1. So min=1.
-            if this_row[col + 10]:
-                next(modules_range_short_iter, None)
-
-    for col in modules_range:
-        modules_range_short_iter = iter(modules_range_short)
-        row = 0
-        for row in modules_range_short_iter:
-            if (
-                not modules[row + 1][col]
-                and modules[row + 4][col]
-                and not modules[row + 5][col]
-                and modules[row + 6][col]
-                and not modules[row + 9][col]
-                and (
-                    modules[row + 0][col]
-                    and modules[row + 2][col]
-                    and modules[row + 3][col]
-                    and not modules[row + 7][col]
-                    and not modules[row + 8][col]
-                    and not modules[row + 10][col]
-                    or not modules[row + 0][col]
-                    and not modules[row + 2][col]
-                    and not modules[row + 3][col]
-                    and modules[row + 7][col]
-                    and modules[row + 8][col]
-                    and modules[row + 10][col]
-                )
-            ):
-                lost_point += 40
-            if modules[row + 10][col]:
-                next(modules_range_short_iter, None)
+def _finder_like_count(matrices, modules_count):
+    # Slide an 11 module window along each row, folding the window into an
+    # 11-bit integer (first module is the most significant bit).
+    windows = modules_count - 10
+    if windows <= 0:  # pragma: no cover
+        return np.zeros(matrices.shape[0], dtype=np.int64)
+    codes = np.zeros(matrices.shape[:-1] + (windows,), dtype=np.uint16)
+    for offset in range(11):
+        codes <<= 1
+        codes |= matrices[..., offset : offset + windows]
+    found = (codes == LEVEL3_PATTERN_1) | (codes == LEVEL3_PATTERN_2)
+    return found.sum(axis=(1, 2), dtype=np.int64)
 
-    return lost_point
 
+def _lost_point_level3(matrices, modules_count):
+    count = _finder_like_count(matrices, modules_count)
+    count += _finder_like_count(matrices.transpose(0, 2, 1), modules_count)
+    return count * 40
 
-def _lost_point_level4(modules, modules_count):
-    dark_count = sum(map(sum, modules))
-    percent = float(dark_count) / (modules_count**2)
-    # Every 5% departure from 50%, rating++
-    rating = int(abs(percent * 100 - 50) / 5)
-    return rating * 10
+
+def _lost_point_level4(matrices, modules_count):
+    dark_counts = matrices.sum(axis=(1, 2), dtype=np.int64)
+    ratings = []
+    for dark_count in dark_counts.tolist():
+        percent = float(dark_count) / (modules_count**2)
+        # Every 5% departure from 50%, rating++
+        ratings.append(int(abs(percent * 100 - 50) / 5))
+    return np.array(ratings, dtype=np.int64) * 10
 
 
 def optimal_data_chunks(data, minimum=4):
@@ -500,40 +448,29 @@ def create_bytes(buffer: BitBuffer, rs_blocks: List[RSBlock]):
     offset = 0
 
     maxDcCount = 0
-    maxEcCount = 0
 
     dcdata: List[List[int]] = []
-    ecdata: List[List[int]] = []
 
     for rs_block in rs_blocks:
         dcCount = rs_block.data_count
-        ecCount = rs_block.total_count - dcCount
-
         maxDcCount = max(maxDcCount, dcCount)
-        maxEcCount = max(maxEcCount, ecCount)
 
         current_dc = [0xFF & buffer.buffer[i + offset] for i in range(dcCount)]
         offset += dcCount
 
-        # Get error correction polynomial.
-        if ecCount in LUT.rsPoly_LUT:
-            rsPoly = base.Polynomial(LUT.rsPoly_LUT[ecCount], 0)
-        else:
-            rsPoly = base.Polynomial([1], 0)
-            for i in range(ecCount):
-                rsPoly = rsPoly * base.Polynomial([1, base.gexp(i)], 0)
-
-        rawPoly = base.Polynomial(current_dc, len(rsPoly) - 1)
+        dcdata.append(current_dc)
 
-        modPoly = rawPoly % rsPoly
-        current_ec = []
-        mod_offset = len(modPoly) - ecCount
-        for i in range(ecCount):
-            modIndex = i + mod_offset
-            current_ec.append(modPoly[modIndex] if (modIndex >= 0) else 0)
+    # All blocks of a code have the same number of error correction codewords.
+    maxEcCount = rs_blocks[0].total_count - rs_blocks[0].data_count
 
-        dcdata.append(current_dc)
-        ecdata.append(current_ec)
+    if len(dcdata) == 1:
+        ecdata = [base.rs_encode(dcdata[0], maxEcCount)]
+    else:
+        # Left pad the shorter blocks with zeros to encode them in one batch.
+        padded = np.zeros((len(dcdata), maxDcCount), dtype=np.uint8)
+        for row, dc in zip(padded, dcdata):
+            row[maxDcCount - len(dc) :] = dc
+        ecdata = base.rs_encode_batch(padded, maxEcCount).tolist()
 
     data = []
     for i in range(maxDcCount):
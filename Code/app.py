@@ -6,12 +6,13 @@ from flask import (
     redirect,
     url_for,
     flash,
+    jsonify,
 )
 from werkzeug.utils import secure_filename
 
 from config import Config
 from encoder import encode
-from decoder import decode
+from jobs import JobQueue, QueueFull, decode_upload
 from image_utils import list_supported_formats
 
 app = Flask(__name__)
@@ -19,7 +20,14 @@ app.config.from_object(Config)
 
 app.jinja_env.globals.update(supported_formats=list_supported_formats())
 
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+job_queue = JobQueue(
+    app.config["JOB_WORKERS"],
+    app.config["JOB_MAX_PENDING"],
+    app.config["JOB_MAX_FINISHED"],
+    decode_threads=app.config["JOB_DECODE_THREADS"],
+    decode_cache_db=app.config["DECODE_CACHE_DB"] or app.config["JOB_DECODE_CACHE_DB"],
+)
+
 os.makedirs("static/generated", exist_ok=True)
 
 
@@ -36,54 +44,98 @@ def home():
     return redirect(url_for("encoder_page"))
 
 
-@app.route("/encoder", methods=["GET", "POST"])
-def encoder_page():
-    image_url = None
+def encode_args(form):
+    """Arguments for encode() from the encoder form fields.
 
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()  
-        qr_type = request.form.get("type")
-        output_format = request.form.get("format", "png")  
-        if not name:
-            flash("Please provide a name for your QR code")
-            return redirect(request.url)
+    Raises:
+        ValueError: with a message for the user if the form is incomplete
+    """
+    name = form.get("name", "").strip()
+    qr_type = form.get("type")
+    output_format = form.get("format", "png")
+    if not name:
+        raise ValueError("Please provide a name for your QR code")
 
-        if not qr_type:
-            flash("Type is required")
-            return redirect(request.url)
+    if not qr_type:
+        raise ValueError("Type is required")
 
-        if qr_type == "2":
-            data2 = request.form.get("data2", "").strip()
-            data3 = request.form.get("data3", "").strip()
+    if qr_type == "2":
+        data2 = form.get("data2", "").strip()
+        data3 = form.get("data3", "").strip()
 
-            if not data2 or not data3:
-                flash("Data 2 and Data 3 are required for Type 2")
-                return redirect(request.url)
+        if not data2 or not data3:
+            raise ValueError("Data 2 and Data 3 are required for Type 2")
 
-            image_path = encode(name, "2", data3, data2, data1=None, format=output_format)
+        return name, "2", data3, data2, None, output_format
 
-        elif qr_type == "3":
-            data1 = request.form.get("data1", "").strip()
-            data2 = request.form.get("data2", "").strip()
-            data3 = request.form.get("data3", "").strip()
+    elif qr_type == "3":
+        data1 = form.get("data1", "").strip()
+        data2 = form.get("data2", "").strip()
+        data3 = form.get("data3", "").strip()
 
-            if not data1 or not data2 or not data3:
-                flash("Data 1, Data 2, and Data 3 are required for Type 3")
-                return redirect(request.url)
+        if not data1 or not data2 or not data3:
+            raise ValueError("Data 1, Data 2, and Data 3 are required for Type 3")
 
-            image_path = encode(name, "3", data3, data2, data1, format=output_format)
+        return name, "3", data3, data2, data1, output_format
 
-        else:
-            flash("Invalid OQR type")
-            return redirect(request.url)
+    raise ValueError("Invalid OQR type")
+
+
+def uploaded_file():
+    """The uploaded file's (bytes, secure name).
+
+    Raises:
+        ValueError: with a message for the user if there is no usable file
+    """
+    file = request.files.get("file")
+
+    if not file or not file.filename or file.filename == "":
+        raise ValueError("No file selected")
+
+    if not allowed_file(file.filename):
+        raise ValueError("File type not allowed")
 
-        if not image_path:
-            flash("QR generation failed. Please try again with different data.")
+    return file.read(), secure_filename(file.filename)
+
+
+def encode_result(image_path):
+    if not image_path:
+        return None
+    return url_for("static", filename=f"generated/{os.path.basename(image_path)}")
+
+
+@app.route("/encoder", methods=["GET", "POST"])
+def encoder_page():
+    image_url = None
+
+    if request.method == "POST":
+        try:
+            args = encode_args(request.form)
+            job_id = job_queue.submit("encode", encode, *args)
+        except ValueError as e:
+            flash(str(e))
             return redirect(request.url)
+        except QueueFull:
+            flash("The server is busy, please try again in a moment")
+            return render_template("encoder.html", image_url=None), 503
+
+        return redirect(url_for("encoder_page", job=job_id))
+
+    job_id = request.args.get("job")
+    if job_id:
+        status = job_queue.status(job_id)
+        if status is None:
+            flash("Unknown or expired job")
+        elif status["status"] in ("queued", "running"):
+            return render_template("encoder.html", image_url=None, job_pending=True)
+        else:
+            image_url = encode_result(job_queue.result(job_id))
+            if not image_url:
+                flash("QR generation failed. Please try again with different data.")
+                return redirect(url_for("encoder_page"))
 
-        flash(f"QR code generated successfully in {output_format.upper()} format!", "success")
-        filename = os.path.basename(image_path)
-        image_url = url_for("static", filename=f"generated/{filename}")
+            output_format = os.path.splitext(image_url)[1].lstrip(".")
+            flash(f"QR code generated successfully in {output_format.upper()} format!", "success")
 
     return render_template("encoder.html", image_url=image_url)
 
@@ -94,27 +146,98 @@ def decoder_page():
     error_message = None
 
     if request.method == "POST":
-        file = request.files.get("file")
-
-        if not file or not file.filename or file.filename == "":
-            flash("No file selected")
+        try:
+            data, filename = uploaded_file()
+            # Decoded straight from the upload, nothing is written to disk
+            job_id = job_queue.submit("decode", decode_upload, data, filename)
+        except ValueError as e:
+            flash(str(e))
             return redirect(request.url)
+        except QueueFull:
+            flash("The server is busy, please try again in a moment")
+            return render_template("decoder.html", v1=v1, v2=v2, v3=v3, error_message=error_message), 503
+
+        return redirect(url_for("decoder_page", job=job_id))
+
+    job_id = request.args.get("job")
+    if job_id:
+        status = job_queue.status(job_id)
+        if status is None:
+            flash("Unknown or expired job")
+        elif status["status"] in ("queued", "running"):
+            return render_template("decoder.html", v1=v1, v2=v2, v3=v3, error_message=error_message, job_pending=True)
+        else:
+            v1, v2, v3 = job_queue.result(job_id) or (None, None, None)
 
-        if not allowed_file(file.filename):
-            flash("File type not allowed")
-            return redirect(request.url)
+            if v1 is None and v2 is None and v3 is None:
+                error_message = "NO OQR DETECTED - Try Again"
+                flash("No QR codes detected in the image. Please try with a clearer image.", "error")
 
-        filename = secure_filename(file.filename)
-        path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(path)
+    return render_template("decoder.html", v1=v1, v2=v2, v3=v3, error_message=error_message)
 
-        v1, v2, v3 = decode(path)
-        
-        if v1 is None and v2 is None and v3 is None:
-            error_message = "NO OQR DETECTED - Try Again"
-            flash("No QR codes detected in the image. Please try with a clearer image.", "error")
 
-    return render_template("decoder.html", v1=v1, v2=v2, v3=v3, error_message=error_message)
+def job_urls(job_id):
+    return {
+        "job_id": job_id,
+        "status_url": url_for("job_status", job_id=job_id),
+        "result_url": url_for("job_result", job_id=job_id),
+    }
+
+
+def busy_response():
+    response = jsonify({"error": "The server is busy, please try again in a moment"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+@app.route("/api/encode", methods=["POST"])
+def api_encode():
+    try:
+        args = encode_args(request.get_json(silent=True) or request.form)
+        return jsonify(job_urls(job_queue.submit("encode", encode, *args))), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull:
+        return busy_response()
+
+
+@app.route("/api/decode", methods=["POST"])
+def api_decode():
+    try:
+        data, filename = uploaded_file()
+        qr_type = request.form.get("type", "3")
+        return jsonify(job_urls(job_queue.submit("decode", decode_upload, data, filename, qr_type))), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull:
+        return busy_response()
+
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(status)
+
+
+@app.route("/api/jobs/<job_id>/result")
+def job_result(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if status["status"] in ("queued", "running"):
+        return jsonify(status), 202
+    if status["status"] == "failed":
+        return jsonify(status), 500
+
+    result = job_queue.result(job_id)
+    if status["kind"] == "encode":
+        status["result"] = {"image_url": encode_result(result)}
+    else:
+        status["result"] = dict(zip(("v1", "v2", "v3"), result))
+    return jsonify(status)
 
 
 if __name__ == "__main__":
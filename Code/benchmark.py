@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark OQR generation time and peak memory (RSS) of a generation worker.
+Each case runs in a fresh worker process so peaks don't carry over.
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from Processing.OQRGenerator import OQR_Generator
+
+# (type, ECC levels, payload length): payload lengths picked to land on
+# small, medium and large versions for the H layers
+CASES = [
+    ("2", ["H", "L"], 10),
+    ("2", ["H", "L"], 60),
+    ("2", ["H", "L"], 150),
+    ("3", ["H", "H", "L"], 10),
+    ("3", ["H", "H", "L"], 60),
+    ("3", ["H", "H", "L"], 150),
+]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def run_case(case):
+    type, error, length = case
+    values = [chr(ord("a") + i) * length for i in range(len(error))]
+    oqr_generator = OQR_Generator()
+
+    start_rss = peak_rss_mb()
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = oqr_generator.generateOQR("benchmark", type, error, values)
+    elapsed = time.time() - start
+
+    return result[0].shape, elapsed, start_rss, peak_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OQR generation time and peak memory per worker")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Runs per case (default: 1)")
+    args = parser.parse_args()
+
+    print(f"{'type':>4} {'ecc':>5} {'length':>6} {'image':>11} {'seconds':>8} {'base MB':>8} {'peak MB':>8}")
+    for case in CASES:
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                shape, elapsed, start_rss, peak_rss = executor.submit(run_case, case).result()
+            type, error, length = case
+            print(f"{type:>4} {''.join(error):>5} {length:>6} {shape[0]:>5}x{shape[1]:<5} {elapsed:>8.2f} {start_rss:>8.1f} {peak_rss:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
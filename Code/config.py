@@ -13,7 +13,9 @@ class Config:
         "bmp": "BMP (Bitmap)",
         "tiff": "TIFF (Tagged Image File Format)",
         "tif": "TIF (Tagged Image File Format)",
-        "webp": "WEBP (WebP Image Format)"
+        "webp": "WEBP (WebP Image Format)",
+        "svg": "SVG (Scalable Vector Graphics)",
+        "pdf": "PDF (Portable Document Format)"
     }
     
     # File formats allowed for decoder input
@@ -21,3 +23,28 @@ class Config:
         "png", "jpg", "jpeg", "gif", "bmp", "tiff", "tif", "webp",
         "mp4", "mov", "avi", "mkv"
     }
+    
+    # Decode result cache, keyed by a hash of the image: results kept in memory,
+    # and an optional SQLite file that keeps them across restarts (None: off)
+    DECODE_CACHE_SIZE = 1024
+    DECODE_CACHE_DB = None
+    
+    # Background jobs for the encoder/decoder: worker processes (None: one per
+    # CPU), jobs allowed to wait or run before requests are turned away, and
+    # finished jobs kept for their results to be fetched
+    JOB_WORKERS = None
+    JOB_MAX_PENDING = 16
+    JOB_MAX_FINISHED = 1000
+    
+    # Threads each job worker decodes variants on (None: the CPUs shared out
+    # between the workers, at least one)
+    JOB_DECODE_THREADS = None
+    
+    # Each job worker has its own in-memory decode cache, so unless
+    # DECODE_CACHE_DB is set they share results through this SQLite file
+    JOB_DECODE_CACHE_DB = os.path.join(UPLOAD_FOLDER, ".decode_cache.sqlite")
+    
+    # Generated OQRs are reused for identical requests; once the cached images
+    # in static/generated take more than this many bytes, the least recently
+    # used are deleted
+    GENERATED_CACHE_BYTES = 512 * 1024 * 1024
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(data):
+    """Cache key of an encoded image buffer or an image array: a hash of its bytes
+    (and, for arrays, its shape and type)."""
+    digest = hashlib.blake2b(digest_size=20)
+    if hasattr(data, "shape"):
+        digest.update(f"{data.shape}{data.dtype}".encode())
+        data = data.tobytes() if not data.flags.c_contiguous else data.data
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class DecodeCache:
+    """Decode results by content key, in an LRU dict in memory and optionally in
+    a SQLite file, so results survive restarts and are shared between processes.
+
+    Entries are {"values": [...], "variants": [...]}: the values decoded from an
+    image and, for each, the preprocessing variant that found it.
+    """
+
+    def __init__(self, max_entries=1024, db_path=None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS decode_cache ("
+                "key TEXT PRIMARY KEY, decoded TEXT NOT NULL, variants TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        """Entry cached under key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry
+
+            if self._db is not None:
+                row = self._db.execute("SELECT decoded, variants FROM decode_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = {"values": json.loads(row[0]), "variants": json.loads(row[1])}
+                    self._remember(key, entry)
+                    self.hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key, values, variants):
+        entry = {"values": list(values), "variants": list(variants)}
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO decode_cache (key, decoded, variants, created) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(entry["values"]), json.dumps(entry["variants"]), time.time()),
+                )
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Hit/miss counters: hits split into memory and disk hits, and the
+        number of entries held in memory."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.hits - self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import re
+
+import cv2
+
+# Preprocessing variants bwdecoder can try, by name, in their default order:
+# the upscaled image as is, then median blurred with kernel sizes 3..29
+VARIANTS = {"raw": None}
+VARIANTS.update({f"median{k}": k for k in range(3, 30, 2)})
+
+DEFAULT_SCHEDULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "decode_schedule.json")
+
+
+def preprocess(gray, variant):
+    """Apply a named preprocessing variant to a grayscale image."""
+    kernel_size = VARIANTS[variant]
+    if kernel_size is None:
+        return gray
+    return cv2.medianBlur(gray, kernel_size)
+
+
+def read_dataset_values(file_path):
+    """Read a dataset values file (e.g. Dataset/Values3Layer.txt).
+
+    Each entry is a name such as 3L_OQR_1_LHQ_1 followed by one value per layer
+    and a blank line. Returns a dict of name -> list of values.
+    """
+    entries = {}
+    entry = []
+    with open(file_path, "r") as f:
+        lines = [line.rstrip("\n") for line in f] + [""]
+    for line in lines:
+        if line.strip():
+            entry.append(line)
+        elif entry:
+            entries[entry[0]] = entry[1:]
+            entry = []
+    return entries
+
+
+def default_order(mode, stages=()):
+    """Order stages are tried in without a learned schedule: the variants in
+    their listed order in "blur" mode; in "pyramid" mode every level as is,
+    finest first, then every level with its variant."""
+    if mode == "blur":
+        return list(VARIANTS)
+    return sorted(stages, key=lambda stage: ("+" in stage, int(re.match(r"pyramid(\d+)", stage).group(1)), stage))
+
+
+class DecodeSchedule:
+    """Order in which bwdecoder tries its decode stages: the preprocessing
+    variants in "blur" mode, the pyramid levels (e.g. "pyramid2" or
+    "pyramid2+median3") in "pyramid" mode.
+
+    While learning, the schedule keeps per mode and QR type which layers (by
+    depth, 0 being the first value of a dataset entry) each stage recovered
+    on each training image. Stages are ordered greedily: first the one that
+    recovers the most image/layer pairs, then the one that adds the most pairs
+    not yet covered, and so on. Stages that add nothing go last, or are
+    dropped when pruning. With no statistics for a type the default order is
+    used.
+
+    Only the learned orders are saved, as {mode: {qr_type: {"order": [...],
+    "useful": number of stages that add coverage}}}.
+    """
+
+    def __init__(self, path=None, prune=False):
+        self.path = path
+        self.prune = prune
+        # {mode: {qr_type: {image name: {stage: [layer depths found]}}}}
+        self.stats = {}
+        # {mode: {qr_type: {"order": [stages], "useful": count}}}
+        self.orders = {}
+
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def load(self, path):
+        with open(path, "r") as f:
+            self.orders = json.load(f)
+
+    def save(self, path=None):
+        path = path or self.path
+        for mode, types in self.stats.items():
+            for qr_type, images in types.items():
+                self.orders.setdefault(mode, {})[qr_type] = self._greedy_order(mode, images)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.orders, f, indent=1, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, path)
+
+    def record(self, qr_type, image_name, stage, depths, mode="blur"):
+        """Record the layer depths stage recovered on a training image."""
+        images = self.stats.setdefault(mode, {}).setdefault(str(qr_type), {})
+        images.setdefault(image_name, {})[stage] = sorted(set(depths))
+
+    def hit_counts(self, qr_type, mode="blur"):
+        """Number of layers each stage recovered, per depth: {stage: {depth: hits}}."""
+        images = self.stats.get(mode, {}).get(str(qr_type), {})
+        counts = {stage: {} for stage in default_order(mode, {s for found in images.values() for s in found})}
+        for found in images.values():
+            for stage, depths in found.items():
+                for depth in depths:
+                    counts[stage][depth] = counts[stage].get(depth, 0) + 1
+        return counts
+
+    def _learned(self, qr_type, mode):
+        # Statistics being learned take precedence over the saved order
+        images = self.stats.get(mode, {}).get(str(qr_type))
+        if images:
+            return self._greedy_order(mode, images)
+        return self.orders.get(mode, {}).get(str(qr_type))
+
+    def stages(self, qr_type, mode="blur"):
+        """Every stage the schedule orders for qr_type, pruned or not."""
+        learned = self._learned(qr_type, mode)
+        return learned["order"] if learned else default_order(mode)
+
+    def order(self, qr_type, mode="blur"):
+        """Stage names to try for qr_type, likely winners first."""
+        learned = self._learned(qr_type, mode)
+        if not learned:
+            return default_order(mode)
+        return learned["order"][:learned["useful"]] if self.prune else learned["order"]
+
+    def _greedy_order(self, mode, images):
+        hits = {stage: set() for stage in default_order(mode, {s for found in images.values() for s in found})}
+        for name, found in images.items():
+            for stage, depths in found.items():
+                if stage in hits:
+                    hits[stage].update((name, depth) for depth in depths)
+
+        order = []
+        covered = set()
+        remaining = list(hits)
+        while remaining:
+            # max keeps the first of equal gains, i.e. the default order
+            best = max(remaining, key=lambda stage: len(hits[stage] - covered))
+            if not hits[best] - covered:
+                break
+            order.append(best)
+            covered |= hits[best]
+            remaining.remove(best)
+
+        return {"order": order + remaining, "useful": len(order)}
+
+
+_default_schedule = None
+
+
+def get_default_schedule():
+    """Schedule bwdecoder uses when none is given, loaded once from
+    OQR_DECODE_SCHEDULE or decode_schedule.json next to this file."""
+    global _default_schedule
+    if _default_schedule is None:
+        path = os.getenv("OQR_DECODE_SCHEDULE", DEFAULT_SCHEDULE_PATH)
+        _default_schedule = DecodeSchedule(path, prune=bool(os.getenv("OQR_DECODE_PRUNE")))
+    return _default_schedule
+
+
+def main():
+    import decoder
+
+    dataset_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dataset")
+
+    parser = argparse.ArgumentParser(description="Learn the bwdecoder preprocessing schedule from the OQR datasets")
+    parser.add_argument("--dataset", default=dataset_dir, help="Dataset directory (default: ../Dataset)")
+    parser.add_argument("-o", "--output", default=DEFAULT_SCHEDULE_PATH, help="Schedule file to update (default: decode_schedule.json)")
+    parser.add_argument("-n", "--limit", type=int, default=None, help="Images per dataset (default: all)")
+    # The bundled dataset images are clean renders: raw decodes every layer the
+    # median variants do, so a blur order learned from them would only prune
+    # the variants camera images need
+    parser.add_argument("--modes", nargs="+", choices=("blur", "pyramid"), default=["pyramid"],
+                        help="Modes to learn orders for (default: pyramid; blur needs a dataset of camera images)")
+
+    args = parser.parse_args()
+
+    schedule = DecodeSchedule(args.output)
+    for layers in ("2", "3"):
+        values = read_dataset_values(os.path.join(args.dataset, f"Values{layers}Layer.txt"))
+        image_dir = os.path.join(args.dataset, f"OQR_Dataset_{layers}Layer")
+        for mode in args.modes:
+            decoder.learn_schedule(schedule, layers, image_dir, values, limit=args.limit, mode=mode)
+    schedule.save(args.output)
+
+    for mode in args.modes:
+        for layers in ("2", "3"):
+            print(f"{mode}, {layers} layers: {' '.join(schedule.order(layers, mode))}")
+            for stage, counts in schedule.hit_counts(layers, mode).items():
+                print(f"  {stage:>16}: " + " ".join(f"depth {d}: {n}" for d, n in sorted(counts.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,585 @@
 import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
 import os
+import re
+import statistics
+import sys
 import time
 import glob
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
 import cv2
 import numpy as np
 import zxingcpp
 
+from config import Config
+from decode_cache import DecodeCache, content_key
+from decode_schedule import VARIANTS, get_default_schedule, preprocess, read_dataset_values
+
 SUPPORTED_IMAGE_FORMATS = ('png', 'jpg', 'jpeg', 'bmp', 'tiff', 'tif', 'webp')
 
+# Dataset image names: <layers>L_OQR_<id>_<ecc levels>_<variant>, e.g. 3L_OQR_1_LHQ_2
+DATASET_NAME = re.compile(r"^(\d)L_OQR_(\d+)_([LMQH]+)_(\d+)$")
 
-def bwdecoder(qr_type, images):
-    values = []
+# Traditional QR images generated alongside an OQR: <name>_qr<i>[.<ext>]
+SIBLING_NAME = re.compile(r"^(.+)_qr(\d+)(?:\.([^.]+))?$")
+# Sibling images whose decoded values are kept in memory
+SIBLING_CACHE_SIZE = 256
+
+BATCH_FIELDS = ("file", "layers", "id", "ecc", "variant", "expected", "decoded", "found", "recall", "ok", "seconds", "error")
+
+
+# zxing-cpp and OpenCV release the GIL, so variants decode in parallel threads
+DECODE_WORKERS = int(os.getenv("OQR_DECODE_WORKERS", 0)) or min(len(VARIANTS), os.cpu_count() or 1)
+
+# Longest side of the downscaled copy finder patterns are looked for on
+LOCATE_MAX_SIDE = 800
+# Largest finder pattern candidates considered when pairing them into codes
+LOCATE_MAX_FINDERS = 40
+# Regions covering more than this share of an image are decoded as the whole image
+LOCATE_MAX_COVERAGE = 0.5
+# Margin around a code's corner finder centers, in finder sizes
+LOCATE_MARGIN = 2
+
+# Pyramid levels stop before their shorter side drops below this many pixels
+PYRAMID_MIN_SIDE = 64
+# Level sizes whose spare buffers are kept for later pyramids
+PYRAMID_BUFFER_SHAPES = 16
+
+# Module state, created on first use by the functions below
+_state_lock = threading.Lock()
+_variant_executor = None
+_CACHE_UNSET = object()
+_decode_cache = _CACHE_UNSET
+_pyramid_buffers = None
+_sibling_index = None
+
+
+def _get_variant_executor():
+    global _variant_executor
+    with _state_lock:
+        if _variant_executor is None:
+            _variant_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="bwdecoder")
+        return _variant_executor
+
+
+def _get_pyramid_buffers():
+    global _pyramid_buffers
+    with _state_lock:
+        if _pyramid_buffers is None:
+            _pyramid_buffers = _PyramidBuffers()
+        return _pyramid_buffers
+
+
+def get_sibling_index():
+    """SiblingIndex decode() looks sibling QR images up in."""
+    global _sibling_index
+    with _state_lock:
+        if _sibling_index is None:
+            _sibling_index = SiblingIndex()
+        return _sibling_index
+
+
+def get_decode_cache():
+    """Decode result cache set up from config.Config (DECODE_CACHE_SIZE,
+    DECODE_CACHE_DB) on first use; None when both are disabled."""
+    global _decode_cache
+    if _decode_cache is _CACHE_UNSET:
+        configure_decode_cache(Config.DECODE_CACHE_SIZE, Config.DECODE_CACHE_DB)
+    return _decode_cache
+
+
+def configure_decode_workers(threads):
+    """Set the number of threads bwdecoder decodes variants on. The pool is
+    started again on next use, e.g. in a forked worker process."""
+    global DECODE_WORKERS, _variant_executor
+    with _state_lock:
+        DECODE_WORKERS = threads
+        _variant_executor = None
+
+
+def configure_decode_cache(max_entries, db_path=None):
+    """Replace the decode result cache; max_entries=0 and no db_path disables it."""
+    global _decode_cache
+    if _decode_cache not in (None, _CACHE_UNSET):
+        _decode_cache.close()
+    _decode_cache = DecodeCache(max_entries, db_path) if max_entries > 0 or db_path else None
+    return _decode_cache
+
+
+def _prepare_gray(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape[:2]
+    return cv2.resize(gray, (width * 2, height * 2), interpolation=cv2.INTER_LINEAR)
+
+
+def _decode_variant(gray, variant="raw"):
+    """Decode one preprocessing variant (see decode_schedule.VARIANTS) of gray.
+    Returns the QR code texts found, in zxing's order."""
     debug = bool(os.getenv("OQR_DEBUG"))
 
+    result = zxingcpp.read_barcodes(preprocess(gray, variant))
+    if debug and variant == "raw":
+        print(f"[bwdecoder] raw result count: {len(result) if result else 0}")
+
+    texts = []
+    for res in result or []:
+        text = str(res.text).strip()
+        fmt = str(res.format)
+        if debug:
+            label = "found" if variant == "raw" else f"variant {variant}"
+            print(f"[bwdecoder] {label} format={fmt} text={text}")
+        if fmt.lower().endswith("qrcode"):
+            texts.append(text)
+    return texts
+
+
+def locate_regions(img, max_side=LOCATE_MAX_SIDE):
+    """Find the regions of img likely to hold a QR code.
+
+    Finder patterns (a dark square in a light ring in a dark square) are looked
+    for on a copy downscaled to max_side pixels. Finders of similar size that
+    form the three corners of a code give a region: the bounding box of the
+    code's four corners, widened for the quiet zone and any tilt.
+
+    Returns:
+        List of (x, y, width, height) regions in img's pixels, largest first
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    height, width = gray.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    small = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+
+    finders = []
+    for i, contour in enumerate(contours):
+        child = hierarchy[0][i][2]
+        if child < 0 or hierarchy[0][child][2] < 0:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        if w >= 7 and h >= 7 and 0.5 < w / h < 2:
+            finders.append((x, y, w, h))
+
+    # Three finders of a code sit at the corners of an isosceles right
+    # triangle, about two finder widths apart or more. Take the triplets made of
+    # the largest finders first, each finder belonging to one code at most
+    finders = sorted(finders, key=lambda f: -f[2] * f[3])[:LOCATE_MAX_FINDERS]
+    centers = [np.array([x + w / 2, y + h / 2]) for x, y, w, h in finders]
+    used = set()
+    regions = []
+    for a, b, c in itertools.combinations(range(len(finders)), 3):
+        if used & {a, b, c}:
+            continue
+        sizes = [finders[i][2] for i in (a, b, c)]
+        if max(sizes) > 1.5 * min(sizes):
+            continue
+        for corner, p, q in ((a, b, c), (b, a, c), (c, a, b)):
+            side1 = np.linalg.norm(centers[p] - centers[corner])
+            side2 = np.linalg.norm(centers[q] - centers[corner])
+            hypotenuse = np.linalg.norm(centers[p] - centers[q])
+            if (min(side1, side2) >= 1.8 * max(sizes) and max(side1, side2) < 1.2 * min(side1, side2)
+                    and abs(hypotenuse - np.sqrt(2) * (side1 + side2) / 2) < 0.15 * hypotenuse):
+                break
+        else:
+            continue
+
+        used.update((a, b, c))
+        size = max(sizes)
+        fourth = centers[p] + centers[q] - centers[corner]
+        points = np.array([centers[a], centers[b], centers[c], fourth])
+        # Widen around the corner centers: half a finder to the code's edge,
+        # the rest for the quiet zone, tilt and finders found a little inside
+        # the code
+        margin = LOCATE_MARGIN * size
+        x0, y0 = np.maximum(points.min(axis=0) - margin, 0)
+        x1, y1 = np.minimum(points.max(axis=0) + margin, (small.shape[1], small.shape[0]))
+        regions.append((int(x0 / scale), int(y0 / scale), int(np.ceil((x1 - x0) / scale)), int(np.ceil((y1 - y0) / scale))))
+
+    return sorted(regions, key=lambda r: -r[2] * r[3])
+
+
+class _PyramidBuffers:
+    """Spare pyramid level buffers by shape, reused by later pyramids of the
+    same size. A buffer taken is only given back once no decode task can read
+    it any more, so pyramids in use never share one."""
+
+    def __init__(self, max_shapes=PYRAMID_BUFFER_SHAPES):
+        self.max_shapes = max_shapes
+        self._free = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, shape, dtype):
+        with self._lock:
+            free = self._free.get((shape, dtype))
+            if free:
+                self._free.move_to_end((shape, dtype))
+                return free.pop()
+        return np.empty(shape, dtype=dtype)
+
+    def give(self, buffers):
+        with self._lock:
+            for buf in buffers:
+                self._free.setdefault((buf.shape, buf.dtype), []).append(buf)
+                self._free.move_to_end((buf.shape, buf.dtype))
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+
+    def give_when_done(self, buffers, futures):
+        """Give buffers back once all futures, the tasks reading them, are done
+        or cancelled."""
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                self.give(buffers)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+
+def build_pyramid(gray, min_side=PYRAMID_MIN_SIDE, buffers=None):
+    """Gaussian pyramid of gray, halving each level until its shorter side
+    would drop below min_side. If buffers is a list, the levels below gray are
+    written into spare buffers of earlier pyramids and added to it; they must
+    be given back with _get_pyramid_buffers().give() once unused."""
+    levels = [gray]
+    while min(levels[-1].shape[:2]) // 2 >= min_side:
+        src = levels[-1]
+        if buffers is None:
+            levels.append(cv2.pyrDown(src))
+            continue
+        shape = ((src.shape[0] + 1) // 2, (src.shape[1] + 1) // 2)
+        levels.append(cv2.pyrDown(src, dst=_get_pyramid_buffers().take(shape, src.dtype)))
+        buffers.append(levels[-1])
+    return levels
+
+
+def _decode_ladder(tasks, values, needed, sources=None, buffers=()):
+    """Decode (gray, variant, label) tasks on the variant pool, adding new
+    values to values in task order. Results are merged in submission order and
+    merging stops after the first task that brings the values to needed, as
+    running the tasks one after another would; the rest are cancelled. If
+    sources is a dict, the label of the task that found each value is added.
+    The pyramid buffers the tasks read are given back once they have all
+    finished, which may be after this returns."""
+    executor = _get_variant_executor()
+    futures = [executor.submit(_decode_variant, gray, v) for gray, v, _ in tasks]
+    if buffers:
+        _get_pyramid_buffers().give_when_done(buffers, futures)
+    try:
+        for (_, _, label), future in zip(tasks, futures):
+            for text in future.result():
+                if text not in values:
+                    values.append(text)
+                    if sources is not None:
+                        sources[text] = label
+            if len(values) >= needed:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _ladder_tasks(grays, order, mode, level_variant, known=(), buffers=None):
+    """Decode tasks for grays: each variant in order in "blur" mode; in
+    "pyramid" mode each level as is and with level_variant, in order (stages
+    missing from it last, in their default order, unless they are known to the
+    schedule, i.e. pruned). Pyramid buffers are added to buffers, see
+    build_pyramid."""
+    if mode == "pyramid":
+        levels = [(level, f"pyramid{i}") for gray in grays for i, level in enumerate(build_pyramid(gray, buffers=buffers))]
+        tasks = [(level, "raw", label) for level, label in levels]
+        if level_variant:
+            tasks += [(level, level_variant, f"{label}+{level_variant}") for level, label in levels]
+        rank = {stage: i for i, stage in enumerate(order)}
+        tasks = [task for task in tasks if task[2] in rank or task[2] not in known]
+        return sorted(tasks, key=lambda task: rank.get(task[2], len(rank)))
+    return [(gray, v, v) for v in order for gray in grays]
+
+
+def bwdecoder(qr_type, images, schedule=None, localize=True, mode="blur", level_variant="median3", sources=None):
+    """Decode up to qr_type distinct QR values from images.
+
+    With localize, only the regions found by locate_regions are upscaled and
+    decoded, unless they cover most of the image. The whole image is decoded
+    only when there are none or none of them yields a value. When they yield
+    some of the qr_type values in "blur" mode, the layers left are looked for
+    on their pyramid levels instead: zxing only downscales large images far
+    enough for the coarsest layers, so a whole page may give them where its
+    crop doesn't.
+
+    In "blur" mode the preprocessing variants of all regions of an image are
+    decoded variant by variant in the order given by schedule
+    (decode_schedule.get_default_schedule() if None). In "pyramid" mode each
+    region's Gaussian pyramid (see build_pyramid) is built once and every
+    level decoded as is and after level_variant (a decode_schedule variant
+    name; None to skip), in the order the schedule learned for these stages,
+    by default finest level first and the level_variant ones last.
+
+    All tasks of an image are dispatched to a thread pool at once, so the pool
+    starts on the likely winners. Their results are taken in task order and
+    the remaining tasks cancelled once the tasks taken so far have found
+    qr_type distinct values, so the values and their order are the ones running
+    the tasks one after another would give.
+
+    If sources is a dict, each value is mapped in it to the variant that found
+    it, e.g. "median5" or "pyramid2+median3".
+    """
+    values = []
+    needed = int(qr_type)
+    schedule = schedule or get_default_schedule()
+    order = schedule.order(qr_type, mode)
+    known = set(schedule.stages(qr_type, mode))
+
     for img in images:
         if img is None:
             continue
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        height, width = gray.shape[:2]
-        gray = cv2.resize(gray, (width * 2, height * 2), interpolation=cv2.INTER_LINEAR)
+        regions = locate_regions(img) if localize else []
+        # Cropping only pays off when the codes leave much of the image blank
+        if sum(w * h for _, _, w, h in regions) > LOCATE_MAX_COVERAGE * img.shape[0] * img.shape[1]:
+            regions = []
+        found = len(values)
+        if regions:
+            grays = [_prepare_gray(img[y:y + h, x:x + w]) for x, y, w, h in regions]
+            buffers = []
+            _decode_ladder(_ladder_tasks(grays, order, mode, level_variant, known, buffers), values, needed, sources, buffers)
+            if found < len(values) < needed and mode == "blur":
+                buffers = []
+                tasks = _ladder_tasks(grays, schedule.order(qr_type, "pyramid"), "pyramid", level_variant,
+                                      set(schedule.stages(qr_type, "pyramid")), buffers)
+                _decode_ladder(tasks, values, needed, sources, buffers)
+        if len(values) == found < needed:
+            buffers = []
+            _decode_ladder(_ladder_tasks([_prepare_gray(img)], order, mode, level_variant, known, buffers), values, needed, sources, buffers)
+        if len(values) >= needed:
+            return values
 
-        result = zxingcpp.read_barcodes(gray)
-        if debug:
-            print(f"[bwdecoder] raw result count: {len(result) if result else 0}")
-        if result:
-            for res in result:
-                text = str(res.text).strip()
-                fmt = str(res.format)
-                if debug:
-                    print(f"[bwdecoder] found format={fmt} text={text}")
-                if fmt.lower().endswith("qrcode") and text not in values:
-                    values.append(text)
+    return values
 
-        for kernel_size in range(3, 30, 2):
-            blurred = cv2.medianBlur(gray, kernel_size)
-            result = zxingcpp.read_barcodes(blurred)
-            if result:
-                for res in result:
-                    text = str(res.text).strip()
-                    fmt = str(res.format)
-                    if debug:
-                        print(f"[bwdecoder] blurred k={kernel_size} format={fmt} text={text}")
-                    if fmt.lower().endswith("qrcode") and text not in values:
-                        values.append(text)
-            if len(values) >= int(qr_type):
-                return values
 
-    return values
+def learn_schedule(schedule, qr_type, image_dir, values, limit=None, mode="blur", level_variant="median3"):
+    """Run every decode stage of mode on the dataset images in image_dir, on
+    the regions bwdecoder would crop, and record in schedule which layers each
+    one recovered.
+
+    Args:
+        schedule: DecodeSchedule to record into
+        qr_type: Number of layers of the images
+        image_dir: Directory of images named after their dataset entries
+        values: Dict of entry name -> layer values (see read_dataset_values)
+        limit: Only use the first limit images (default: all)
+        mode: "blur" for the preprocessing variants, "pyramid" for the pyramid levels
+        level_variant: Variant the pyramid levels are also decoded with
+    """
+    executor = _get_variant_executor()
+    names = sorted(n for n in os.listdir(image_dir) if os.path.splitext(n)[0] in values)
+
+    for name in names[:limit]:
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is None:
+            continue
+        image_name = os.path.splitext(name)[0]
+        layers = [v.strip() for v in values[image_name]]
+
+        regions = locate_regions(img)
+        if not regions or sum(w * h for _, _, w, h in regions) > LOCATE_MAX_COVERAGE * img.shape[0] * img.shape[1]:
+            regions = [(0, 0, img.shape[1], img.shape[0])]
+        grays = [_prepare_gray(img[y:y + h, x:x + w]) for x, y, w, h in regions]
+
+        buffers = []
+        tasks = _ladder_tasks(grays, list(VARIANTS), mode, level_variant, buffers=buffers)
+        futures = [(label, executor.submit(_decode_variant, gray, v)) for gray, v, label in tasks]
+        found = {}
+        for label, future in futures:
+            found.setdefault(label, set()).update(future.result())
+        _get_pyramid_buffers().give(buffers)
+        for stage, texts in found.items():
+            schedule.record(qr_type, image_name, stage, [depth for depth, value in enumerate(layers) if value in texts], mode)
+
+        if os.getenv("OQR_DEBUG"):
+            print(f"[learn_schedule] {name}: {schedule.stats[mode][str(qr_type)][image_name]}")
+
 
+class SiblingIndex:
+    """Index of the traditional QR images generated next to an OQR
+    (<name>_qr<i>.<ext>, or with no extension), by directory, base name and
+    layer.
+
+    Paths found are remembered, so a later lookup only checks they still
+    exist; the candidate names of a layer are looked for on a miss, never by
+    listing the directory. Values decoded from sibling images are cached by
+    path, modification time and size. Both are least recently used first out
+    once cache_size entries are cached.
+    """
 
-def decode_image(file_path, qr_type="3"):
-    img = cv2.imread(file_path)
+    def __init__(self, cache_size=SIBLING_CACHE_SIZE):
+        self.cache_size = cache_size
+        # (directory, base name, i) -> [paths, preferred first]
+        self._paths = OrderedDict()
+        self._decoded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def siblings(self, directory, base_name, i):
+        """Paths of base_name's i-th sibling image in directory, ordered like
+        SUPPORTED_IMAGE_FORMATS, extensionless last."""
+        key = (directory, base_name, i)
+        with self._lock:
+            paths = self._paths.get(key)
+            if paths is not None:
+                self._paths.move_to_end(key)
+        if paths and all(os.path.isfile(path) for path in paths):
+            return list(paths)
+
+        stem = os.path.join(directory, f"{base_name}_qr{i}")
+        candidates = [f"{stem}.{ext}" for ext in SUPPORTED_IMAGE_FORMATS] + [stem]
+        paths = [path for path in candidates if os.path.isfile(path)]
+        with self._lock:
+            if paths:
+                self._paths[key] = paths
+                self._paths.move_to_end(key)
+                while len(self._paths) > self.cache_size:
+                    self._paths.popitem(last=False)
+            else:
+                self._paths.pop(key, None)
+        return list(paths)
+
+    def decode(self, path):
+        """Values of the sibling image at path (decoded once per version of
+        the file), or None if it cannot be read."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._decoded:
+                self._decoded.move_to_end(key)
+                return list(self._decoded[key])
+
+        img = cv2.imread(path)
+        if img is None:
+            return None
+        values = bwdecoder("1", [img])
+
+        with self._lock:
+            self._decoded[key] = values
+            while len(self._decoded) > self.cache_size:
+                self._decoded.popitem(last=False)
+        return list(values)
+
+
+def _cached_bwdecoder(key, load_image, qr_type, mode):
+    """bwdecoder on the image returned by load_image, through the decode cache
+    under key. None if the image cannot be loaded."""
+    cache = get_decode_cache()
+    if cache is not None:
+        key = f"{key}:{qr_type}:{mode}"
+        entry = cache.get(key)
+        if entry is not None:
+            return list(entry["values"])
+
+    img = load_image()
     if img is None:
+        return None
+
+    sources = {}
+    values = bwdecoder(qr_type, [img], mode=mode, sources=sources)
+    if cache is not None:
+        cache.put(key, values, [sources.get(v) for v in values])
+    return values
+
+
+def decode_image(file_path, qr_type="3", mode="blur"):
+    try:
+        buf = np.fromfile(file_path, dtype=np.uint8)
+    except OSError:
+        buf = np.empty(0, dtype=np.uint8)
+
+    base_dir = os.path.dirname(file_path)
+    search_dirs = [base_dir]
+    if "uploads" in base_dir:
+        search_dirs.append("static/generated")
+
+    values = _cached_bwdecoder(content_key(buf), lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR) if buf.size else None, qr_type, mode)
+    if values is None:
         print(f"Error: Could not read image from {file_path}")
         return None, None, None
 
-    values = bwdecoder(qr_type, [img])
-    if not values or len(values) < int(qr_type):
-        base_dir = os.path.dirname(file_path)
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        search_dirs = [base_dir]
-        
-        if "uploads" in base_dir:
-            search_dirs.append("static/generated")
-        
+    return _complete_values(values, qr_type, os.path.basename(file_path), search_dirs)
+
+
+def decode_bytes(buf, qr_type="3", name=None, search_dirs=("static/generated",), mode="blur"):
+    """Decode OQR values from an encoded image (PNG, JPEG, ...) held in memory.
+
+    See decode_array for the arguments. Returns (v1, v2, v3) where values may
+    be None if not found.
+    """
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    values = _cached_bwdecoder(content_key(buf), lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR) if buf.size else None, qr_type, mode)
+    if values is None:
+        print(f"Error: Could not decode image {name or ''}".rstrip())
+        return None, None, None
+
+    return _complete_values(values, qr_type, name, search_dirs)
+
+
+def decode_array(img, qr_type="3", name=None, search_dirs=("static/generated",), mode="blur"):
+    """Decode OQR values from a BGR image array.
+
+    Args:
+        img: BGR image, as returned by cv2.imread
+        qr_type: Number of expected values
+        name: File name the image goes by; when values are missing, the
+            traditional QR images generated next to it (<name>_qr1.png, ...)
+            are looked for in search_dirs
+        search_dirs: Directories to look for those sibling images in
+        mode: bwdecoder mode, "blur" or "pyramid"
+
+    Returns (v1, v2, v3) where values may be None if not found, all of them
+    if img is None or empty.
+    """
+    if img is None or img.size == 0:
+        print(f"Error: Could not read image {name or ''}".rstrip())
+        return None, None, None
+
+    values = _cached_bwdecoder(content_key(img), lambda: img, qr_type, mode)
+    return _complete_values(values, qr_type, name, search_dirs)
+
+
+def _complete_values(values, qr_type, name, search_dirs):
+    """Fill in values missing from an OQR's decode from its sibling QR images,
+    then report them as (v1, v2, v3)."""
+    values = list(values or [])
+    if name and (not values or len(values) < int(qr_type)):
+        base_name = os.path.splitext(os.path.basename(name))[0]
+
+        index = get_sibling_index()
         for search_dir in search_dirs:
             for i in range(1, int(qr_type) + 1):
-                found_sibling = False
-                
-                for ext in SUPPORTED_IMAGE_FORMATS:
-                    sibling_with_dot = os.path.join(search_dir, f"{base_name}_qr{i}.{ext}")
-                    if os.path.isfile(sibling_with_dot):
-                        s_img = cv2.imread(sibling_with_dot)
-                        if s_img is None:
-                            continue
-                        found = bwdecoder("1", [s_img])
-                        if found:
-                            for v in found:
-                                if v not in values:
-                                    values.append(v)
-                        found_sibling = True
-                        break
-                
-                if not found_sibling:
-                    sibling_without_dot = os.path.join(search_dir, f"{base_name}_qr{i}")
-                    if os.path.isfile(sibling_without_dot):
-                        s_img = cv2.imread(sibling_without_dot)
-                        if s_img is None:
-                            continue
-                        found = bwdecoder("1", [s_img])
-                        if found:
-                            for v in found:
-                                if v not in values:
-                                    values.append(v)
+                for sibling in index.siblings(search_dir, base_name, i):
+                    found = index.decode(sibling)
+                    if found is None:
+                        continue
+                    for v in found:
+                        if v not in values:
+                            values.append(v)
+                    break
 
     if not values:
         if os.getenv("OQR_DEBUG"):
@@ -130,39 +614,145 @@ def decode(file_path, qr_type="3"):
     return decode_image(file_path, qr_type=qr_type)
 
 
-def decode_from_capture(source, qr_type="3", timeout=30):
+class _LatestFrame:
+    """Newest frame read by a capture thread. A live source's older unread
+    frames are dropped; a file's put() waits for the reader to take() the
+    previous frame instead."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.taken = 0
+        self.done = False
+        self.closed = False
+
+    def put(self, frame, wait=False):
+        with self.condition:
+            if wait:
+                self.condition.wait_for(lambda: self.taken >= self.seq or self.closed)
+            self.frame = frame
+            self.seq += 1
+            self.condition.notify_all()
+
+    def take(self, seq):
+        """Mark the frames up to seq as taken by the reader."""
+        with self.condition:
+            self.taken = max(self.taken, seq)
+            self.condition.notify_all()
+
+    def close(self):
+        """Stop waiting for the reader, which has stopped taking frames."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def wait_newer(self, seq, timeout):
+        """Wait up to timeout for a frame newer than seq: (frame, seq, done)."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > seq or self.done, timeout)
+            return self.frame, self.seq, self.done
+
+
+def _capture_frames(cap, latest, stop, live):
+    # A camera is paced at its frame rate and frames arriving while the
+    # workers are busy get dropped; a file is read as fast as its frames are
+    # taken, so none is lost
+    interval = 1.0 / cap.get(cv2.CAP_PROP_FPS) if live and cap.get(cv2.CAP_PROP_FPS) > 0 else 0
+    next_frame = time.time()
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        latest.put(frame, wait=not live)
+        if interval:
+            next_frame += interval
+            time.sleep(max(0.0, next_frame - time.time()))
+    latest.finish()
+
+
+def _frame_signature(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def decode_from_capture(source, qr_type="3", timeout=30, workers=2, diff_threshold=2.0, vote_window=10, min_votes=1, mode="blur"):
+    """Decode OQR values from a video file or camera.
+
+    For a camera, a capture thread keeps only the latest frame while a pool of
+    workers runs bwdecoder on it, so decoding never falls behind the stream;
+    a video file is read as fast as the workers take its frames, none of them
+    dropped. Frames whose 64x64 thumbnail differs from the last decoded one
+    by less than diff_threshold (mean absolute gray level difference) are
+    skipped. A value is accepted once it is seen in min_votes of the last
+    vote_window decoded frames. Stops at qr_type accepted values, the end of
+    the stream or timeout.
+    """
     cap = cv2.VideoCapture(source)
     if not cap.isOpened():
         print(f"Error: cannot open capture source {source}")
         return None, None, None
 
     values = []
+    needed = int(qr_type)
     start = time.time()
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    latest = _LatestFrame()
+    stop = threading.Event()
+    capture = threading.Thread(target=_capture_frames, args=(cap, latest, stop, isinstance(source, int)), name="capture-reader", daemon=True)
+    capture.start()
 
-        found = bwdecoder(qr_type, [frame])
-        if found:
-            for v in found:
-                if v not in values:
-                    values.append(v)
+    window = deque(maxlen=vote_window)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="capture-decoder")
+    pending = set()
+    submitted_seq = shown_seq = 0
+    last_signature = None
 
-        if len(values) >= int(qr_type):
-            break
-
-        if timeout and (time.time() - start) > timeout:
-            break
+    try:
+        while len(values) < needed:
+            if timeout and (time.time() - start) > timeout:
+                break
 
-        if isinstance(source, int):
-            cv2.imshow("Decoder - press q to quit", frame)
-            if cv2.waitKey(1) & 0xFF == ord("q"):
+            for future in [f for f in pending if f.done()]:
+                pending.remove(future)
+                window.append(set(future.result()))
+                votes = Counter(v for found in window for v in found)
+                for v, count in votes.items():
+                    if count >= min_votes and v not in values:
+                        values.append(v)
+            if len(values) >= needed:
                 break
 
-    cap.release()
-    cv2.destroyAllWindows()
+            frame, seq, done = latest.wait_newer(submitted_seq, 0.01)
+            if seq > submitted_seq and len(pending) < workers:
+                submitted_seq = seq
+                latest.take(seq)
+                signature = _frame_signature(frame)
+                if last_signature is None or np.abs(signature - last_signature).mean() >= diff_threshold:
+                    last_signature = signature
+                    pending.add(pool.submit(bwdecoder, qr_type, [frame], mode=mode))
+            elif done and seq == submitted_seq and not pending:
+                break
+            elif pending:
+                wait(pending, timeout=0.01, return_when=FIRST_COMPLETED)
+
+            if isinstance(source, int) and seq > shown_seq:
+                shown_seq = seq
+                cv2.imshow("Decoder - press q to quit", frame)
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    finally:
+        stop.set()
+        latest.close()
+        pool.shutdown(wait=False, cancel_futures=True)
+        capture.join()
+        cap.release()
+        cv2.destroyAllWindows()
 
     if not values:
         if os.getenv("OQR_DEBUG"):
@@ -189,6 +779,145 @@ def decode_from_capture(source, qr_type="3", timeout=30):
     return v1, v2, v3
 
 
+def _init_batch_worker(threads):
+    configure_decode_workers(threads)
+    # Batches measure decoding, not the cache
+    configure_decode_cache(0)
+
+
+def _decode_batch_item(path, qr_type, mode):
+    """Decode one image of a batch in a worker process: (decoded values, seconds, error)."""
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            values = decode_image(path, qr_type=qr_type, mode=mode)
+        return [v for v in values if v is not None], time.perf_counter() - start, None
+    except Exception as e:
+        return [], time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def collect_batch_paths(sources):
+    """Expand directories and glob patterns into a sorted list of image paths."""
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [os.path.join(source, n) for n in os.listdir(source)]
+        else:
+            matches = glob.glob(source)
+        paths.update(p for p in matches if os.path.isfile(p) and p.rsplit(".", 1)[-1].lower() in SUPPORTED_IMAGE_FORMATS)
+    return sorted(paths)
+
+
+def _expected_values(path, layers, values_files, cache):
+    """Values of the dataset entry named after path, from values_files or from
+    Values<layers>Layer.txt next to the image's directory. None if unknown."""
+    candidates = list(values_files) or [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(path))), f"Values{layers}Layer.txt")]
+    name = os.path.splitext(os.path.basename(path))[0]
+    for values_file in candidates:
+        if values_file not in cache:
+            cache[values_file] = read_dataset_values(values_file) if os.path.isfile(values_file) else {}
+        if name in cache[values_file]:
+            return [v.strip() for v in cache[values_file][name]]
+    return None
+
+
+def decode_batch(paths, qr_type=None, values_files=(), workers=None, threads=1, mode="blur"):
+    """Decode many images across a pool of worker processes.
+
+    Images named after dataset entries (see DATASET_NAME) are decoded with their
+    own number of layers and checked against the entry's values.
+
+    Args:
+        paths: Image paths
+        qr_type: Number of expected values, overriding the one from the name
+        values_files: Dataset values files to check against (default:
+            Values<layers>Layer.txt in the parent of each image's directory)
+        workers: Number of worker processes (default: number of CPUs)
+        threads: Variant decoding threads per worker (default: 1)
+        mode: bwdecoder mode, "blur" or "pyramid" (default: "blur")
+
+    Yields:
+        One result dict per image (see BATCH_FIELDS), as soon as it is decoded
+    """
+    values_cache = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(threads,)) as executor:
+        futures = {}
+        for path in paths:
+            match = DATASET_NAME.match(os.path.splitext(os.path.basename(path))[0])
+            record = dict.fromkeys(BATCH_FIELDS)
+            record["file"] = path
+            if match:
+                record.update(layers=int(match.group(1)), id=int(match.group(2)), ecc=match.group(3), variant=int(match.group(4)))
+                record["expected"] = _expected_values(path, record["layers"], values_files, values_cache)
+            layers = qr_type or record["layers"] or 3
+            futures[executor.submit(_decode_batch_item, path, str(layers), mode)] = record
+
+        for future in as_completed(futures):
+            record = futures[future]
+            record["decoded"], record["seconds"], record["error"] = future.result()
+            record["seconds"] = round(record["seconds"], 4)
+            if record["expected"] is not None:
+                record["found"] = [v in record["decoded"] for v in record["expected"]]
+                record["recall"] = sum(record["found"]) / len(record["found"])
+                record["ok"] = all(record["found"])
+            yield record
+
+
+def batch_main(argv=None):
+    parser = argparse.ArgumentParser(prog="decoder.py decode-batch", description="Decode a directory or glob of OQR images and report recall and timings")
+    parser.add_argument("sources", nargs="+", help="Image directories or glob patterns, e.g. 'Dataset/OQR_Dataset_3Layer/*.png'")
+    parser.add_argument("-t", "--type", default=None, help="Number of expected values (default: from the file name, else 3)")
+    parser.add_argument("--values", action="append", default=[], help="Dataset values file to check against (default: Values<n>Layer.txt next to the image directory)")
+    parser.add_argument("-o", "--output", default=None, help="Results file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"), default=None, help="Results format (default: from the output extension, else jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--threads", type=int, default=1, help="Variant decoding threads per worker (default: 1)")
+    parser.add_argument("-m", "--mode", choices=("blur", "pyramid"), default="blur", help="Decode with the median blur ladder or an image pyramid (default: blur)")
+
+    args = parser.parse_args(argv)
+
+    paths = collect_batch_paths(args.sources)
+    if not paths:
+        print("Error: no images found", file=sys.stderr)
+        return 1
+
+    fmt = args.format or ("csv" if args.output and args.output.lower().endswith(".csv") else "jsonl")
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=BATCH_FIELDS)
+        writer.writeheader()
+
+    start = time.perf_counter()
+    seconds = []
+    found = expected = complete = checked = 0
+    try:
+        for record in decode_batch(paths, args.type, args.values, args.workers, args.threads, args.mode):
+            seconds.append(record["seconds"])
+            if record["found"] is not None:
+                checked += 1
+                found += sum(record["found"])
+                expected += len(record["found"])
+                complete += record["ok"]
+
+            if writer:
+                writer.writerow({k: json.dumps(v) if isinstance(v, list) else v for k, v in record.items()})
+            else:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Decoded {len(seconds)} images in {elapsed:.2f}s ({len(seconds) / elapsed:.2f} images/s), "
+          f"median {statistics.median(seconds):.3f}s per image", file=sys.stderr)
+    if checked:
+        print(f"Recall: {found}/{expected} layers ({found / expected:.1%}), {complete}/{checked} images fully decoded", file=sys.stderr)
+    return 0
+
+
 def _is_int_string(s):
     try:
         int(s)
@@ -198,10 +927,15 @@ def _is_int_string(s):
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Decode OQR values from image or video/camera")
+    if len(sys.argv) > 1 and sys.argv[1] == "decode-batch":
+        sys.exit(batch_main(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description="Decode OQR values from image or video/camera (or run 'decode-batch -h')")
     parser.add_argument("source", help="Image path, video path, or camera index (int)")
     parser.add_argument("-t", "--type", default="3", help="Number of expected values (default: 3)")
     parser.add_argument("--timeout", type=int, default=30, help="Timeout seconds for video/camera (default: 30)")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Frames decoded at once for video/camera (default: 2)")
+    parser.add_argument("-m", "--mode", choices=("blur", "pyramid"), default="blur", help="Decode with the median blur ladder or an image pyramid (default: blur)")
 
     args = parser.parse_args()
 
@@ -209,11 +943,11 @@ def main():
 
     if _is_int_string(src) and not os.path.exists(src):
         src_id = int(src)
-        decode_from_capture(src_id, qr_type=args.type, timeout=args.timeout)
+        decode_from_capture(src_id, qr_type=args.type, timeout=args.timeout, workers=args.workers, mode=args.mode)
     elif os.path.isfile(src):
-        decode_image(src, qr_type=args.type)
+        decode_image(src, qr_type=args.type, mode=args.mode)
     else:
-        decode_from_capture(src, qr_type=args.type, timeout=args.timeout)
+        decode_from_capture(src, qr_type=args.type, timeout=args.timeout, workers=args.workers, mode=args.mode)
 
 
 if __name__ == "__main__":
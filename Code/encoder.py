@@ -8,6 +8,9 @@ from Processing.qrcode import constants, main
 from Processing.ImageModification import Modify_Image
 from Processing.QRHelper import QR_Helper
 from Processing.OQRGenerator import OQR_Generator
+from image_utils import save_bands
+from config import Config
+from generated_cache import GeneratedCache, artifact_key, write_atomic
 
 SUPPORTED_FORMATS = {
     'png': '.png',
@@ -16,9 +19,15 @@ SUPPORTED_FORMATS = {
     'bmp': '.bmp',
     'tiff': '.tiff',
     'tif': '.tif',
-    'webp': '.webp'
+    'webp': '.webp',
+    'svg': '.svg',
+    'pdf': '.pdf'
 }
 
+# Formats the OQR is drawn to as vector graphics; its siblings are then saved
+# as PNG for the decoder to read
+VECTOR_FORMATS = {'svg', 'pdf'}
+
 def get_image_extension(format_str):
     """
     Get the proper file extension for the given format.
@@ -27,6 +36,15 @@ def get_image_extension(format_str):
     format_lower = format_str.lower().strip('.')
     return SUPPORTED_FORMATS.get(format_lower, '.png')
 
+def get_sibling_extension(format_str):
+    """
+    Get the file extension the sibling QRs of an OQR in the given format are
+    saved with: the OQR's own, or '.png' for vector formats.
+    """
+    if format_str.lower().strip('.') in VECTOR_FORMATS:
+        return '.png'
+    return get_image_extension(format_str)
+
 def convert_image_format(image_data, target_format):
     """
     Ensure image can be saved in the target format.
@@ -74,7 +92,7 @@ def readValues(fileName):
     return [x.rstrip('\n') for x in data]
 
 
-def generateOQR(name, type, data3, data2, data1=None, format='png'):
+def generateOQR(name, type, data3, data2, data1=None, format='png', directory='static/generated'):
     """
     Generate OQR code and save in specified format.
     
@@ -84,7 +102,8 @@ def generateOQR(name, type, data3, data2, data1=None, format='png'):
         data3: Third data field
         data2: Second data field
         data1: First data field (optional, None for Type 2)
-        format: Output format - 'png', 'jpg', 'jpeg', 'bmp', 'tiff', 'webp' (default: 'png')
+        format: Output format - 'png', 'jpg', 'jpeg', 'bmp', 'tiff', 'webp', or 'svg'/'pdf' for vector output (default: 'png')
+        directory: Directory the images are written to (default: 'static/generated')
     
     Returns:
         Path to the generated QR code image, or None if generation failed
@@ -93,71 +112,118 @@ def generateOQR(name, type, data3, data2, data1=None, format='png'):
     n_error = "H"
     f_error = "L"
     oqr_generator = OQR_Generator()
+    qr_helper = QR_Helper()
     
     if type == "2":
-        result = oqr_generator.generateOQR(name, type, [n_error, f_error], [data2, data3])
+        errors, vals = [n_error, f_error], [data2, data3]
     elif type == "3":
-        result = oqr_generator.generateOQR(name, type, [fn_error, n_error, f_error], [data1, data2, data3])
+        errors, vals = [fn_error, n_error, f_error], [data1, data2, data3]
     else:
         print("Invalid Type")
         return None
     
-    if result is not None and len(result) > 0:
-        color_img = np.array(result[0]).astype(np.uint8)
-        color_img = cv2.cvtColor(color_img, cv2.COLOR_GRAY2BGR)
-        
-        os.makedirs("static/generated", exist_ok=True)
-        
-        file_ext = get_image_extension(format)
-        output_path = f"static/generated/{name}{file_ext}"
-        
-        processed_img, save_params = convert_image_format(color_img, format)
-        
-        if save_params:
-            cv2.imwrite(output_path, processed_img, save_params)
-        else:
-            cv2.imwrite(output_path, processed_img)
-        print(f"OQR saved: {output_path} ({format.upper()})")
-        
+    # Each layer is encoded once: the OQR is composed from the layers, and the
+    # sibling QRs are drawn from the same matrices
+    layers = oqr_generator.generateLayers(name, errors, vals)
+    shape, bands = oqr_generator.composeBands(type, layers)
+    
+    os.makedirs(directory, exist_ok=True)
+    
+    file_ext = get_image_extension(format)
+    output_path = os.path.join(directory, f"{name}{file_ext}")
+    sibling_ext = get_sibling_extension(format)
+    
+    if format.lower().strip('.') in VECTOR_FORMATS:
+        write_atomic(output_path, lambda path: oqr_generator.generateOQRVector(type, layers, path))
+        format = 'png'
+    else:
+        # Rasterized band by band so the full-size OQR is never held in memory
+        write_atomic(output_path, lambda path: save_bands(path, shape, bands, format))
+    print(f"OQR saved: {output_path}")
+    
+    for idx, (val, layer) in enumerate(zip(vals, layers)):
+        if not val:
+            continue
         try:
-            qr_helper = QR_Helper()
-            if type == "2":
-                vals = [data2, data3]
-            else:
-                vals = [data1, data2, data3]
+            qr_img = qr_helper.render(layer)
+            qr_path = os.path.join(directory, f"{name}_qr{idx+1}{sibling_ext}")
             
-            for idx, val in enumerate(vals):
-                if not val:
-                    continue
-                try:
-                    qr = qr_helper.generateTraditionalQR(str(val), None, constants.ERROR_CORRECT_H)
-                    mat = qr_helper.convertQRToBinary(qr)
-                    qr_img = qr_helper.generateQRImage(mat).astype(np.uint8)
-                    qr_path = f"static/generated/{name}_qr{idx+1}{file_ext}"
-                    
-                    processed_qr, qr_save_params = convert_image_format(qr_img, format)
-                    if qr_save_params:
-                        cv2.imwrite(qr_path, processed_qr, qr_save_params)
-                    else:
-                        cv2.imwrite(qr_path, processed_qr)
-                    print(f"✓ Sibling QR saved: {qr_path} ({format.upper()})")
-                except Exception as e:
-                    print(f"✗ Failed to generate sibling QR {idx+1}: {e}")
+            processed_qr, qr_save_params = convert_image_format(qr_img, format)
+            if qr_save_params:
+                write_atomic(qr_path, lambda path: cv2.imwrite(path, processed_qr, qr_save_params))
+            else:
+                write_atomic(qr_path, lambda path: cv2.imwrite(path, processed_qr))
+            print(f"✓ Sibling QR saved: {qr_path} ({format.upper()})")
         except Exception as e:
-            print(f"✗ Failed to generate sibling QR files: {e}")
-        
-        return output_path
-    else:
-        print(f"✗ Failed to generate OQR: {name}")
-        return None
+            print(f"✗ Failed to generate sibling QR {idx+1}: {e}")
+    
+    return output_path
+
+
+_generated_cache = None
+
+
+def get_generated_cache():
+    """Cache of generated OQRs encode() reuses, created on first use."""
+    global _generated_cache
+    if _generated_cache is None:
+        _generated_cache = GeneratedCache("static/generated", Config.GENERATED_CACHE_BYTES)
+    return _generated_cache
 
 
 def encode(name, type, data3, data2, data1=None, format='png'):
+    """
+    Generate an OQR like generateOQR, reusing a previously generated one.
+
+    Generated OQRs are cached by their type, error correction levels, values and
+    format, under file names made from that key. The OQR and its siblings are
+    then linked to the requested name, so when the same OQR was generated
+    before nothing is generated.
+    
+    Returns:
+        Path to the OQR image, or None if generation failed
+    """
     if format.lower().strip('.') not in SUPPORTED_FORMATS:
         print(f"✗ Unsupported format: {format}. Supported: {', '.join(SUPPORTED_FORMATS.keys())}")
         format = 'png'
     
-    return generateOQR(name, type, data3, data2, data1, format)
+    if type == "2":
+        errors, values = ["H", "L"], [data2, data3]
+    elif type == "3":
+        errors, values = ["H", "H", "L"], [data1, data2, data3]
+    else:
+        return generateOQR(name, type, data3, data2, data1, format)
+    
+    cache = get_generated_cache()
+    key = artifact_key(type, errors, values, format)
+    files = cache.get(key)
+    if files is not None:
+        try:
+            output_path = cache.link(key, files, name)
+            print(f"OQR reused: {output_path} ({format.upper()})")
+            return output_path
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            pass
+    
+    cached_path = generateOQR(key, type, data3, data2, data1, format, directory=cache.cache_dir)
+    if cached_path is None:
+        return None
+    stem = os.path.splitext(cached_path)[0]
+    sibling_ext = get_sibling_extension(format)
+    files = {"": cached_path}
+    files.update({f"_qr{idx+1}": f"{stem}_qr{idx+1}{sibling_ext}" for idx, val in enumerate(values) if val})
+    try:
+        cache.put(key, files)
+    except FileNotFoundError as e:
+        # A sibling failed to generate; drop the rest so no file is left
+        # in the cache directory outside the index
+        print(f"✗ {e}")
+        for f in files.values():
+            if os.path.isfile(f):
+                os.remove(f)
+        return None
+    return cache.link(key, cache.get(key) or files, name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Bumped whenever generation changes so artifacts from older code are not reused
+ARTIFACT_VERSION = 1
+
+
+def artifact_key(type, errors, values, format):
+    """Cache key of a generated OQR: a hash of its type, the error correction
+    level and value of each layer, and the output format."""
+    normalized = {
+        "version": ARTIFACT_VERSION,
+        "type": str(type),
+        "errors": list(errors),
+        "values": [None if value is None else str(value) for value in values],
+        "format": format.lower().strip('.'),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def atomic_path(path):
+    """Temporary path next to path, with the same extension so writers that go by
+    it pick the same format. Hidden and not named like a sibling QR, so directory
+    scans never pick up a half-written file."""
+    directory, file_name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=".", suffix=".tmp" + os.path.splitext(file_name)[1])
+    os.close(fd)
+    return tmp_path
+
+
+def write_atomic(path, write):
+    """Call write(tmp_path) and move the result over path in one rename, so
+    readers see either the old file or the complete new one.
+
+    Raises:
+        OSError: if write left no file or an empty one, as cv2.imwrite does
+            when it fails; path is then left as it was
+    """
+    tmp_path = atomic_path(path)
+    try:
+        write(tmp_path)
+        if not os.path.getsize(tmp_path):
+            raise OSError(f"Nothing written to {path}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def link_atomic(source, path):
+    """Make path a hard link to source (a copy where links aren't supported),
+    replacing whatever path was in one rename."""
+    tmp_path = atomic_path(path)
+    try:
+        try:
+            os.remove(tmp_path)
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class GeneratedCache:
+    """Generated OQR images by artifact key.
+
+    An entry is an OQR image and its sibling QR images, stored in the cache
+    subdirectory under names made from the key, so an entry's files never
+    change once written. Requests get them under the names they asked for
+    through link(), which hard links (or copies) them into the output
+    directory.
+
+    Entries and the names linked to them are indexed in a SQLite file, so the
+    index is shared between processes and survives restarts. When the entries'
+    files take more than max_bytes the least recently used entries are deleted,
+    along with the names still linked to them. Eviction never touches files
+    the cache didn't write (e.g. committed samples).
+    """
+
+    def __init__(self, directory="static/generated", max_bytes=512 * 1024 * 1024, db_name=".generated_cache.sqlite"):
+        self.directory = directory
+        self.cache_dir = os.path.join(directory, "cache")
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(self.cache_dir, db_name)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generated ("
+                "key TEXT PRIMARY KEY, files TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, key TEXT NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    def get(self, key):
+        """Files cached under key as {name suffix: path} ("" for the OQR image,
+        "_qr<i>" for its siblings), or None. Entries whose files have gone
+        missing are dropped."""
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT files FROM generated WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            files = json.loads(row[0])
+            if not all(os.path.isfile(f) for f in files.values()):
+                db.execute("DELETE FROM generated WHERE key = ?", (key,))
+                db.commit()
+                return None
+
+            db.execute("UPDATE generated SET accessed = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            return files
+
+    def put(self, key, files):
+        """Record files ({name suffix: path}, as written to cache_dir under
+        names made from key) under key, then evict least recently used entries
+        over max_bytes.
+
+        Raises:
+            FileNotFoundError: if one of the files doesn't exist; nothing is
+                recorded then
+        """
+        missing = [f for f in files.values() if not os.path.isfile(f)]
+        if missing:
+            raise FileNotFoundError(f"Generated files missing for {key}: {', '.join(missing)}")
+        size = sum(os.path.getsize(f) for f in files.values())
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO generated (key, files, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(files), size, time.time()),
+            )
+            db.commit()
+            self._evict(db, keep=key)
+
+    def link(self, key, files, name, max_siblings=3):
+        """Put the cached files of key under name in the output directory, each
+        replaced atomically, and remove name's other siblings (up to
+        max_siblings) left from an earlier OQR.
+
+        Returns:
+            Path of the OQR image under name
+        """
+        targets = {suffix: os.path.join(self.directory, name + suffix + os.path.splitext(source)[1]) for suffix, source in files.items()}
+        for suffix, source in files.items():
+            link_atomic(source, targets[suffix])
+
+        # Siblings of a vector OQR are PNG, so look for stale ones under either
+        exts = {os.path.splitext(source)[1] for source in files.values()}
+        stale = [
+            os.path.join(self.directory, f"{name}_qr{i}{ext}")
+            for i in range(1, max_siblings + 1) if f"_qr{i}" not in files
+            for ext in sorted(exts)
+        ]
+        for path in stale:
+            if os.path.isfile(path):
+                os.remove(path)
+
+        with self._lock:
+            db = self._connect()
+            db.executemany("INSERT OR REPLACE INTO links (path, key) VALUES (?, ?)", [(path, key) for path in targets.values()])
+            db.executemany("DELETE FROM links WHERE path = ?", [(path,) for path in stale])
+            db.commit()
+        return targets[""]
+
+    def _evict(self, db, keep):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM generated").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = db.execute("SELECT key, files, size FROM generated WHERE key != ? ORDER BY accessed", (keep,)).fetchall()
+        for key, files, size in rows:
+            if total <= self.max_bytes:
+                break
+            linked = [path for (path,) in db.execute("SELECT path FROM links WHERE key = ?", (key,))]
+            for f in list(json.loads(files).values()) + linked:
+                if os.path.isfile(f):
+                    os.remove(f)
+            db.execute("DELETE FROM links WHERE key = ?", (key,))
+            db.execute("DELETE FROM generated WHERE key = ?", (key,))
+            total -= size
+        db.commit()
+
+    def stats(self):
+        """Number of cached entries and the bytes their files take."""
+        with self._lock:
+            count, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generated").fetchone()
+            return {"entries": count, "bytes": size, "max_bytes": self.max_bytes}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -3,6 +3,9 @@ Image format utility module for OQR encoder/decoder.
 Provides format validation, conversion, and configuration.
 """
 
+import struct
+import zlib
+
 import cv2
 import numpy as np
 
@@ -14,7 +17,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_PNG_COMPRESSION,
         'quality_value': 9,
         'supports_transparency': True,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': True
     },
     'jpg': {
         'extension': '.jpg',
@@ -22,7 +26,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_JPEG_QUALITY,
         'quality_value': 95,
         'supports_transparency': False,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': False
     },
     'jpeg': {
         'extension': '.jpeg',
@@ -30,7 +35,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_JPEG_QUALITY,
         'quality_value': 95,
         'supports_transparency': False,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': False
     },
     'bmp': {
         'extension': '.bmp',
@@ -38,7 +44,8 @@ SUPPORTED_FORMATS = {
         'quality_param': None,
         'quality_value': None,
         'supports_transparency': False,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': False
     },
     'tiff': {
         'extension': '.tiff',
@@ -46,7 +53,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_TIFF_COMPRESSION,
         'quality_value': 1,
         'supports_transparency': True,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': True
     },
     'tif': {
         'extension': '.tif',
@@ -54,7 +62,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_TIFF_COMPRESSION,
         'quality_value': 1,
         'supports_transparency': True,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': True
     },
     'webp': {
         'extension': '.webp',
@@ -62,7 +71,8 @@ SUPPORTED_FORMATS = {
         'quality_param': cv2.IMWRITE_WEBP_QUALITY,
         'quality_value': 95,
         'supports_transparency': True,
-        'color_space': 'BGR'
+        'color_space': 'BGR',
+        'streamable': False
     }
 }
 
@@ -176,3 +186,146 @@ def get_supported_format_list():
         str: Comma-separated format names
     """
     return ', '.join(sorted(SUPPORTED_FORMATS.keys()))
+
+
+def _write_png_chunk(f, kind, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def _band_rows(band, row_size):
+    """
+    Rows of a grayscale or BGR band as bytes in file order (RGB for color),
+    as a (rows, row_size) array
+    """
+    if band.ndim == 3:
+        band = band[:, :, ::-1]
+    return np.ascontiguousarray(band).reshape(band.shape[0], row_size)
+
+
+def write_png_bands(output_path, shape, bands, compression=9):
+    """
+    Write a grayscale or BGR image to a PNG file band by band.
+    
+    Args:
+        output_path: Path of the PNG file
+        shape: (height, width) of the whole image, or (height, width, 3) for BGR
+        bands: Iterable of uint8 arrays of shape (rows, width[, 3]), top to bottom
+        compression: zlib compression level (0-9)
+    """
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) > 2 else 1
+    row_size = width * channels
+    compressor = zlib.compressobj(compression)
+    previous = np.zeros(row_size, dtype=np.uint8)
+    
+    with open(output_path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        # 8-bit grayscale or RGB, no interlacing
+        color_type = 2 if channels == 3 else 0
+        _write_png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        
+        for band in bands:
+            rows = _band_rows(band, row_size)
+            # "Up" filter: store each row as its difference to the row above,
+            # repeated rows then compress down to almost nothing
+            filtered = np.empty((rows.shape[0], row_size + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            np.subtract(rows[0], previous, out=filtered[0, 1:])
+            np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+            previous = rows[-1].copy()
+            
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                _write_png_chunk(f, b'IDAT', data)
+        
+        _write_png_chunk(f, b'IDAT', compressor.flush())
+        _write_png_chunk(f, b'IEND', b'')
+
+
+def write_tiff_bands(output_path, shape, bands):
+    """
+    Write a grayscale or BGR image to an uncompressed TIFF file band by band.
+    
+    Args:
+        output_path: Path of the TIFF file
+        shape: (height, width) of the whole image, or (height, width, 3) for BGR
+        bands: Iterable of uint8 arrays of shape (rows, width[, 3]), top to bottom
+    """
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) > 2 else 1
+    row_size = width * channels
+    rows_per_strip = max(1, 65536 // row_size)
+    strip_count = -(-height // rows_per_strip)
+    strip_size = rows_per_strip * row_size
+    
+    entry_count = 9
+    # Values that don't fit in their entry are stored after the IFD: the bits
+    # per sample of a color image, then the strip offsets and byte counts
+    bits_start = 8 + 2 + 12 * entry_count + 4
+    offsets_start = bits_start + (8 if channels > 1 else 0)
+    counts_start = offsets_start + 4 * strip_count
+    data_start = counts_start + 4 * strip_count
+    strip_offsets = [data_start + i * strip_size for i in range(strip_count)]
+    strip_counts = [strip_size] * (strip_count - 1) + [(height - rows_per_strip * (strip_count - 1)) * row_size]
+    
+    SHORT, LONG = 3, 4
+    entries = [
+        (256, LONG, 1, width),  # ImageWidth
+        (257, LONG, 1, height),  # ImageLength
+        (258, SHORT, channels, 8 if channels == 1 else bits_start),  # BitsPerSample
+        (259, SHORT, 1, 1),  # Compression: none
+        (262, SHORT, 1, 2 if channels == 3 else 1),  # PhotometricInterpretation: RGB, or black is zero
+        (273, LONG, strip_count, strip_offsets[0] if strip_count == 1 else offsets_start),  # StripOffsets
+        (277, SHORT, 1, channels),  # SamplesPerPixel
+        (278, LONG, 1, rows_per_strip),  # RowsPerStrip
+        (279, LONG, strip_count, strip_counts[0] if strip_count == 1 else counts_start),  # StripByteCounts
+    ]
+    
+    with open(output_path, 'wb') as f:
+        f.write(struct.pack('<2sHI', b'II', 42, 8))
+        f.write(struct.pack('<H', entry_count))
+        for entry in entries:
+            f.write(struct.pack('<HHII', *entry))
+        f.write(struct.pack('<I', 0))
+        if channels > 1:
+            f.write(struct.pack('<4H', *([8] * channels + [0] * (4 - channels))))
+        f.write(struct.pack('<%dI' % strip_count, *strip_offsets))
+        f.write(struct.pack('<%dI' % strip_count, *strip_counts))
+        
+        for band in bands:
+            f.write(_band_rows(band, row_size).tobytes())
+
+
+def save_bands(output_path, shape, bands, format_str):
+    """
+    Save a grayscale or BGR image given as horizontal bands (see write_png_bands).
+    
+    Streamable formats (PNG, TIFF) are written band by band without ever holding
+    the whole image; the others are assembled first and saved with OpenCV.
+    
+    Args:
+        output_path: Path of the image file
+        shape: (height, width) of the whole image, or (height, width, 3) for BGR
+        bands: Iterable of uint8 arrays of shape (rows, width[, 3]), top to bottom
+        format_str: Format string (e.g., 'png', 'jpg', '.jpeg')
+    
+    Raises:
+        OSError: if OpenCV cannot write the image
+    """
+    format_info = get_format_info(format_str) or get_format_info('png')
+    
+    if format_info['streamable'] and format_info['extension'] == '.png':
+        write_png_bands(output_path, shape, bands, format_info['quality_value'])
+    elif format_info['streamable']:
+        write_tiff_bands(output_path, shape, bands)
+    else:
+        image = np.empty(shape, dtype=np.uint8)
+        row = 0
+        for band in bands:
+            image[row:row + band.shape[0]] = band
+            row += band.shape[0]
+        if not cv2.imwrite(output_path, image, get_save_parameters(format_str)):
+            raise OSError(f"Could not write {output_path}")
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+from decoder import configure_decode_cache, configure_decode_workers, decode_bytes, decode_from_capture
+
+VIDEO_EXTENSIONS = {"mp4", "mov", "avi", "mkv"}
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_pending jobs are already waiting or running."""
+
+
+def _init_job_worker(decode_threads, decode_cache_db):
+    configure_decode_workers(decode_threads)
+    if decode_cache_db:
+        os.makedirs(os.path.dirname(decode_cache_db) or ".", exist_ok=True)
+    configure_decode_cache(Config.DECODE_CACHE_SIZE, decode_cache_db)
+
+
+class JobQueue:
+    """In-process job queue running encode/decode work on a local process pool.
+
+    Jobs are identified by an id returned from submit and can be polled with
+    status and result. At most max_pending jobs may be waiting or running at
+    once; beyond that submit raises QueueFull so callers can push back. Only the
+    max_finished most recent finished jobs are kept.
+
+    Each worker decodes on decode_threads threads (by default the CPUs shared
+    out between the workers), so the workers together don't oversubscribe the
+    CPUs. Their decode caches share results through the SQLite file
+    decode_cache_db (None: each worker only caches in memory).
+    """
+
+    def __init__(self, workers=None, max_pending=None, max_finished=1000, decode_threads=None,
+                 decode_cache_db=Config.DECODE_CACHE_DB or Config.JOB_DECODE_CACHE_DB):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.max_finished = max_finished
+        self.decode_threads = decode_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.decode_cache_db = decode_cache_db
+        self._executor = None
+        self._jobs = OrderedDict()
+        # Reentrant: a job that is already done runs its callback inside submit
+        self._lock = threading.RLock()
+
+    def _get_executor(self):
+        # Started on first use so importing the app doesn't spawn workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_job_worker,
+                initargs=(self.decode_threads, self.decode_cache_db),
+            )
+        return self._executor
+
+    def _reset_executor(self, executor):
+        # A worker died (e.g. killed when out of memory) and took the pool
+        # down: its jobs have failed, the next submit starts a new pool
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind, fn, *args):
+        """Queue fn(*args) and return the job id.
+
+        Raises:
+            QueueFull: if max_pending jobs are already waiting or running
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job["future"].done())
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs already queued")
+
+            job_id = uuid.uuid4().hex
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+            self._jobs[job_id] = {"id": job_id, "kind": kind, "future": future, "submitted": time.time(), "finished": None}
+            future.add_done_callback(lambda future, job_id=job_id, executor=executor: self._finished(job_id, future, executor))
+            return job_id
+
+    def _finished(self, job_id, future, executor):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._reset_executor(executor)
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["finished"] = time.time()
+
+            finished = [i for i, j in self._jobs.items() if j["future"].done()]
+            for old_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[old_id]
+
+    def status(self, job_id):
+        """Job status as a dict (id, kind, status, submitted, finished, error),
+        status being queued, running, done or failed. None for unknown ids."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = job["future"]
+
+            error = None
+            if future.done():
+                error = "cancelled" if future.cancelled() else future.exception()
+                state = "failed" if error else "done"
+            else:
+                state = "running" if future.running() else "queued"
+
+            return {
+                "id": job_id,
+                "kind": job["kind"],
+                "status": state,
+                "submitted": job["submitted"],
+                "finished": job["finished"],
+                "error": str(error) if error else None,
+            }
+
+    def result(self, job_id):
+        """Return value of a finished job (None if it is unknown, not finished or failed)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or not job["future"].done() or job["future"].cancelled() or job["future"].exception():
+            return None
+        return job["future"].result()
+
+    def shutdown(self, wait=True):
+        """Stop the workers, cancelling jobs that haven't started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def decode_upload(data, filename, qr_type="3", timeout=30):
+    """Decode an uploaded image or video from its bytes. Videos are written to a
+    temporary file for OpenCV's capture to read; images are decoded in memory.
+
+    Returns (v1, v2, v3) where values may be None if not found.
+    """
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext not in VIDEO_EXTENSIONS:
+        return decode_bytes(data, qr_type=qr_type, name=filename)
+
+    fd, path = tempfile.mkstemp(suffix="." + ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return decode_from_capture(path, qr_type=qr_type, timeout=timeout)
+    finally:
+        os.remove(path)
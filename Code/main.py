@@ -2,6 +2,7 @@ import os
 import cv2
 import csv
 import random
+import argparse
 import numpy as np
 
 from Processing.qrcode import constants, main
@@ -20,6 +21,24 @@ def readValues(fileName):
     data = [x.rstrip('\n') for x in data]
     return data
 
+def readJobs(fileName):
+    """
+    Read a dataset values file (e.g. Dataset/Values3Layer.txt) into generate_batch jobs.
+
+    Each entry is a name such as 3L_OQR_1_LHQ_1 followed by one value per layer and a
+    blank line. The name gives the OQR type (3L) and the ECC level of each value (LHQ).
+    """
+    jobs = []
+    entry = []
+    for line in readValues(fileName) + [""]:
+        if line.strip():
+            entry.append(line)
+        elif entry:
+            name, values = entry[0], entry[1:]
+            jobs.append((name, name[0], list(name.split("_")[3]), values))
+            entry = []
+    return jobs
+
 def generateOQR(name, type, data3, data2, data1=None):
     fn_error = "H"
     n_error = "H"
@@ -39,7 +58,28 @@ def generateOQR(name, type, data3, data2, data1=None):
 
         cv2.imwrite(name+".png", color_img)
         
-        
-generateOQR("Test3", "3", "3", "2", "1")
-        
-generateOQR("Test2", "2", "B", "A")
\ No newline at end of file
+def generateDataset(valuesFile, outputDir, workers=None):
+    folderGeneration([outputDir])
+    oqr_generator = OQR_Generator()
+
+    for name, result in oqr_generator.generate_batch(readJobs(valuesFile), workers=workers, ordered=False):
+        if result is None:
+            continue
+        color_img = cv2.cvtColor(result[0], cv2.COLOR_GRAY2BGR)
+        cv2.imwrite(os.path.join(outputDir, name+".png"), color_img)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate sample OQRs, or regenerate a dataset from its values file")
+    parser.add_argument("values", nargs="?", help="Dataset values file, e.g. ../Dataset/Values3Layer.txt")
+    parser.add_argument("-o", "--output", default="dataset", help="Output directory for the dataset (default: dataset)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+
+    args = parser.parse_args()
+
+    if args.values:
+        generateDataset(args.values, args.output, args.workers)
+    else:
+        generateOQR("Test3", "3", "3", "2", "1")
+
+        generateOQR("Test2", "2", "B", "A")
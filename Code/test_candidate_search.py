@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from Processing.CandidateSearch import CandidateSearch
+from Processing.qrcode import main, util
+
+
+def _module_distance(engine, value):
+    """Modules the code of value differs from s1's code in, both drawn by QRCode."""
+    codes = []
+    for data in (engine.s1, value):
+        qr = main.QRCode(version=engine.version, error_correction=engine.error, border=0, mask_pattern=0)
+        qr.add_data(data)
+        codes.append(np.array(qr.get_matrix()))
+    return int((codes[0] != codes[1]).sum())
+
+
+def _codeword_distance(engine, value):
+    """Bits the codewords of value differ from s1's codewords in, encoded one at a time."""
+    qr = main.QRCode(version=engine.version, error_correction=engine.error, border=0, mask_pattern=0)
+    qr.add_data(value)
+    codewords = util.create_data(engine.version, engine.error, qr.data_list)
+    return sum(bin(a ^ b).count("1") for a, b in zip(codewords, engine.target))
+
+
+@pytest.mark.parametrize("s1, s2, version, ecc", [
+    ("http://baker.co", "Fresh Bread", 2, "L"),
+    ("Nearest", "MID", 3, "H"),
+    # Alphanumeric and numeric prefixes, which QRCode may split into chunks
+    ("Farthest layer", "HELLO WORLD 12345 ABCD", 4, "M"),
+    ("Far", "0123456789", 2, "Q"),
+])
+def test_batched_distances_match_each_candidate_encoded_alone(s1, s2, version, ecc):
+    engine = CandidateSearch(s1, s2, version, ecc)
+    suffixes, lengths = engine.random_suffixes(np.random.default_rng(1), 40)
+    # Runs of capitals after the prefix, the longest one making the value chunked
+    runs = [b"A", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:engine.max_length], b"Zz"]
+    width = max(suffixes.shape[1], max(len(run) for run in runs))
+    suffixes = np.pad(suffixes, ((0, len(runs)), (0, width - suffixes.shape[1])))
+    for row, run in zip(suffixes[-len(runs):], runs):
+        row[:len(run)] = np.frombuffer(run, dtype=np.uint8)
+    lengths = np.concatenate([lengths, [len(run) for run in runs]])
+
+    distances = engine.distances(suffixes, lengths)
+    for suffix, length, distance in zip(suffixes, lengths, distances):
+        value = s2 + bytes(suffix[:length]).decode("ascii")
+        assert distance == _codeword_distance(engine, value) == _module_distance(engine, value)
+
+
+@pytest.mark.parametrize("beam_width", [1, 4])
+@pytest.mark.parametrize("seed", [0, 7, 2024])
+def test_guided_search_never_scores_worse_than_its_random_starts(seed, beam_width):
+    engine = CandidateSearch("http://baker.co", "Fresh", 3, "L")
+    trials = 3000
+    # guidedSearch starts from the best of trials // 10 random suffixes, the
+    # ones randomSearch draws with the same seed
+    _, start = engine.randomSearch(trials // 10, seed)
+    suffix, distance = engine.guidedSearch(trials, beam_width, seed)
+
+    assert distance <= start
+    assert distance == _module_distance(engine, "Fresh" + suffix)
+
+
+def test_search_returns_s2_with_the_suffix_found():
+    engine = CandidateSearch("Nearest", "MID", 2, "H")
+    for method in ("random", "greedy", "beam"):
+        value, distance = engine.search(500, seed=3, method=method)
+        assert value.startswith("MID")
+        assert distance == _module_distance(engine, value)
+    with pytest.raises(ValueError):
+        engine.search(10, method="anneal")
@@ -0,0 +1,79 @@
+import cv2
+import pytest
+
+import decoder
+from decode_cache import DecodeCache, content_key
+
+
+@pytest.fixture
+def decode_cache(monkeypatch):
+    """An in-memory decode cache for decoder, dropped after the test."""
+    monkeypatch.setattr(decoder, "_decode_cache", decoder._CACHE_UNSET)
+    cache = decoder.configure_decode_cache(16)
+    yield cache
+    cache.close()
+
+
+def test_hits_and_misses_are_counted():
+    cache = DecodeCache()
+    assert cache.get("a") is None
+    cache.put("a", ["Alpha"], ["raw"])
+    assert cache.get("a") == {"values": ["Alpha"], "variants": ["raw"]}
+    assert cache.get("a") is not None
+
+    assert cache.stats() == {"hits": 2, "memory_hits": 2, "disk_hits": 0, "misses": 1, "hit_rate": 2 / 3, "entries": 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = DecodeCache(max_entries=2)
+    cache.put("a", ["Alpha"], ["raw"])
+    cache.put("b", ["Bravo"], ["raw"])
+    cache.get("a")
+    cache.put("c", ["Charlie"], ["median3"])
+
+    assert cache.get("b") is None
+    assert cache.get("a")["values"] == ["Alpha"]
+    assert cache.get("c")["values"] == ["Charlie"]
+    assert cache.stats()["entries"] == 2
+
+
+def test_sqlite_entries_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "decode.sqlite")
+    first = DecodeCache(db_path=path)
+    second = DecodeCache(db_path=path)
+    first.put("a", ["Alpha", "Bravo"], ["raw", "median5"])
+
+    assert second.get("a") == {"values": ["Alpha", "Bravo"], "variants": ["raw", "median5"]}
+    assert second.get("a") is not None
+    assert second.stats() == {"hits": 2, "memory_hits": 1, "disk_hits": 1, "misses": 0, "hit_rate": 1.0, "entries": 1}
+    first.close()
+    second.close()
+
+    # And survive the instances
+    reopened = DecodeCache(max_entries=0, db_path=path)
+    assert reopened.get("a")["values"] == ["Alpha", "Bravo"]
+    assert reopened.stats()["entries"] == 0
+    reopened.close()
+
+
+def test_content_key_depends_on_array_shape():
+    img = cv2.QRCodeEncoder.create().encode("Alpha")
+    assert content_key(img) == content_key(img.copy())
+    assert content_key(img) != content_key(img.reshape(1, -1))
+
+
+def test_decodes_are_cached_per_qr_type_and_mode(decode_cache):
+    img = cv2.QRCodeEncoder.create().encode("Alpha")
+    img = cv2.cvtColor(cv2.resize(img, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST), cv2.COLOR_GRAY2BGR)
+
+    assert decoder.decode_array(img, qr_type="1")[0] == "Alpha"
+    assert decoder.decode_array(img, qr_type="1")[0] == "Alpha"
+    assert decode_cache.stats()["hits"] == 1
+
+    # The same image decoded for another number of layers or another mode
+    # is another entry
+    decoder.decode_array(img, qr_type="2")
+    decoder.decode_array(img, qr_type="1", mode="pyramid")
+    assert decode_cache.stats()["misses"] == 3
+    assert decode_cache.stats()["entries"] == 3
+    assert decode_cache.get(f"{content_key(img)}:1:pyramid")["values"] == ["Alpha"]
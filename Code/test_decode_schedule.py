@@ -0,0 +1,33 @@
+from decode_schedule import DEFAULT_SCHEDULE_PATH, VARIANTS, DecodeSchedule, default_order
+
+
+def _learned(prune):
+    schedule = DecodeSchedule(prune=prune)
+    schedule.record("2", "a", "raw", [0])
+    schedule.record("2", "b", "raw", [0])
+    # Adds nothing raw didn't find
+    schedule.record("2", "a", "median3", [0])
+    # The only stage to find the near layer, on one image
+    schedule.record("2", "b", "median13", [0, 1])
+    return schedule
+
+
+def test_pruning_keeps_every_stage_that_finds_a_new_layer():
+    assert _learned(prune=True).order("2") == ["raw", "median13"]
+    assert _learned(prune=False).order("2")[:3] == ["raw", "median13", "median3"]
+    assert sorted(_learned(prune=False).order("2")) == sorted(VARIANTS)
+
+
+def test_saved_orders_are_used_after_loading(tmp_path):
+    path = str(tmp_path / "schedule.json")
+    _learned(prune=False).save(path)
+    loaded = DecodeSchedule(path, prune=True)
+    assert loaded.order("2") == ["raw", "median13"]
+    assert loaded.order("3") == default_order("blur")
+
+
+def test_shipped_schedule_keeps_every_blur_variant():
+    shipped = DecodeSchedule(DEFAULT_SCHEDULE_PATH, prune=True)
+    for qr_type in ("2", "3"):
+        assert shipped.order(qr_type, "blur") == list(VARIANTS)
+        assert shipped.order(qr_type, "pyramid")[0] == "pyramid0"
@@ -0,0 +1,278 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+import pytest
+
+import decoder
+from decode_schedule import DecodeSchedule
+
+
+def _qr_image(text, module=8):
+    """A standard QR code of text, with a 4-module quiet zone, as a BGR image."""
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=module, fy=module, interpolation=cv2.INTER_NEAREST)
+    code = cv2.copyMakeBorder(code, 4 * module, 4 * module, 4 * module, 4 * module, cv2.BORDER_CONSTANT, value=255)
+    return cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+
+
+def _two_codes(first, second):
+    """Two QR codes side by side on a white canvas wider than them."""
+    left, right = _qr_image(first), _qr_image(second)
+    side = left.shape[0]
+    canvas = np.full((side, 4 * side, 3), 255, dtype=np.uint8)
+    canvas[:, :side] = left
+    canvas[:, 3 * side:] = right
+    return canvas, side
+
+
+def test_bwdecoder_falls_back_to_full_image_when_no_region_decodes(monkeypatch):
+    img, side = _two_codes("Alpha", "Bravo")
+    # The region located is the blank middle of the image
+    monkeypatch.setattr(decoder, "locate_regions", lambda img: [(side, 0, side, side)])
+    values = decoder.bwdecoder("2", [img], schedule=DecodeSchedule())
+    assert sorted(values) == ["Alpha", "Bravo"]
+
+
+def test_bwdecoder_keeps_partial_region_values_without_full_image_pass(monkeypatch):
+    img, side = _two_codes("Alpha", "Bravo")
+    # Only the left code is located: its values are all the regions give
+    monkeypatch.setattr(decoder, "locate_regions", lambda img: [(0, 0, side, side)])
+    sources = {}
+    assert decoder.bwdecoder("2", [img], schedule=DecodeSchedule(), sources=sources) == ["Alpha"]
+    assert sources == {"Alpha": "raw"}
+
+
+def test_bwdecoder_localized_partial_decode_is_faster_than_full_image():
+    # One code on a large page, decoded as a 2-layer OQR: one value is all
+    # there is, after every stage has been tried
+    page = np.full((1200, 900, 3), 255, dtype=np.uint8)
+    code = _qr_image("Alpha", module=4)
+    page[400:400 + code.shape[0], 300:300 + code.shape[1]] = code
+
+    timings = {}
+    for localize in (True, False):
+        start = time.perf_counter()
+        assert decoder.bwdecoder("2", [page], schedule=DecodeSchedule(), localize=localize) == ["Alpha"]
+        timings[localize] = time.perf_counter() - start
+    assert timings[True] < timings[False] / 2
+
+
+def test_pyramid_buffers_are_reused_only_once_their_tasks_are_done(monkeypatch):
+    monkeypatch.setattr(decoder, "_pyramid_buffers", decoder._PyramidBuffers())
+    gray = np.random.default_rng(0).integers(0, 256, (300, 400), dtype=np.uint8)
+
+    first = []
+    assert len(decoder.build_pyramid(gray, buffers=first)) - 1 == len(first) == 2
+    task = Future()
+    decoder._pyramid_buffers.give_when_done(first, [task])
+
+    # A task may still read the first pyramid, so a second one gets new buffers
+    second = []
+    decoder.build_pyramid(gray, buffers=second)
+    assert not any(np.shares_memory(a, b) for a in first for b in second)
+    decoder._pyramid_buffers.give(second)
+
+    task.cancel()
+    third = []
+    reused = decoder.build_pyramid(gray, buffers=third)
+    assert any(np.shares_memory(a, b) for a in first for b in third)
+    assert all(np.array_equal(a, b) for a, b in zip(decoder.build_pyramid(gray), reused))
+
+
+def test_decode_array_rejects_missing_images():
+    assert decoder.decode_array(None) == (None, None, None)
+    assert decoder.decode_array(np.empty((0, 0, 3), dtype=np.uint8)) == (None, None, None)
+
+
+def test_sibling_index_looks_up_names_without_listing_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "listdir", lambda *args: pytest.fail("directory listed"))
+    index = decoder.SiblingIndex()
+    directory = str(tmp_path)
+    cv2.imwrite(str(tmp_path / "oqr_qr1.jpg"), _qr_image("Alpha"))
+    cv2.imwrite(str(tmp_path / "oqr_qr1.png"), _qr_image("Alpha"))
+    (tmp_path / "oqr_qr1.txt").write_text("not an image")
+
+    assert index.siblings(directory, "oqr", 1) == [str(tmp_path / "oqr_qr1.png"), str(tmp_path / "oqr_qr1.jpg")]
+    assert index.siblings(directory, "oqr", 2) == []
+
+    # Files written after a lookup are found by the next one, files removed dropped
+    cv2.imwrite(str(tmp_path / "oqr_qr2.png"), _qr_image("Bravo"))
+    assert index.siblings(directory, "oqr", 2) == [str(tmp_path / "oqr_qr2.png")]
+    os.remove(tmp_path / "oqr_qr1.png")
+    assert index.siblings(directory, "oqr", 1) == [str(tmp_path / "oqr_qr1.jpg")]
+
+    assert decoder.decode_array(_qr_image("Alpha"), qr_type="2", name="oqr.png", search_dirs=[directory])[:2] == ("Alpha", "Bravo")
+
+
+def test_sibling_index_decodes_each_file_version_once(tmp_path, monkeypatch):
+    calls = _counting_bwdecoder(monkeypatch)
+    index = decoder.SiblingIndex(cache_size=2)
+    paths = []
+    for i, text in enumerate(["Alpha", "Bravo", "Charlie"]):
+        paths.append(str(tmp_path / f"oqr_qr{i + 1}.png"))
+        cv2.imwrite(paths[-1], _qr_image(text))
+
+    assert index.decode(paths[0]) == ["Alpha"]
+    assert index.decode(paths[1]) == ["Bravo"]
+    assert index.decode(paths[0]) == ["Alpha"]
+    assert len(calls) == 2
+
+    # The least recently used, Bravo, makes room for Charlie
+    assert index.decode(paths[2]) == ["Charlie"]
+    assert index.decode(paths[0]) == ["Alpha"]
+    assert len(calls) == 3
+    assert index.decode(paths[1]) == ["Bravo"]
+    assert len(calls) == 4
+
+    # A rewritten file is decoded again
+    cv2.imwrite(paths[1], _qr_image("Delta", module=6))
+    assert index.decode(paths[1]) == ["Delta"]
+    assert len(calls) == 5
+    assert index.decode(str(tmp_path / "missing.png")) is None
+
+
+def _batch_dataset(tmp_path):
+    """A dataset with a fully and a partly decodable 2-layer entry, plus an
+    image not named after any entry."""
+    image_dir = tmp_path / "OQR_Dataset_2Layer"
+    image_dir.mkdir()
+    full, _ = _two_codes("Alpha", "Bravo")
+    cv2.imwrite(str(image_dir / "2L_OQR_1_HL_1.png"), full)
+    # Only one of the entry's two values is in the image
+    cv2.imwrite(str(image_dir / "2L_OQR_2_HL_3.png"), _qr_image("Charlie"))
+    cv2.imwrite(str(image_dir / "other.png"), _qr_image("Echo"))
+    (tmp_path / "Values2Layer.txt").write_text("2L_OQR_1_HL_1\nAlpha\nBravo\n\n2L_OQR_2_HL_3\nCharlie\nDelta\n")
+    return image_dir
+
+
+def test_dataset_name_parsing():
+    assert decoder.DATASET_NAME.match("3L_OQR_12_LHQ_2").groups() == ("3", "12", "LHQ", "2")
+    assert decoder.DATASET_NAME.match("3L_OQR_12_LHQ_2_qr1") is None
+    assert decoder.DATASET_NAME.match("other") is None
+
+
+def test_decode_batch_records(tmp_path):
+    image_dir = _batch_dataset(tmp_path)
+    records = {os.path.basename(r["file"]): r for r in decoder.decode_batch(decoder.collect_batch_paths([str(image_dir)]), workers=1)}
+    assert sorted(records) == ["2L_OQR_1_HL_1.png", "2L_OQR_2_HL_3.png", "other.png"]
+
+    full = records["2L_OQR_1_HL_1.png"]
+    assert (full["layers"], full["id"], full["ecc"], full["variant"]) == (2, 1, "HL", 1)
+    assert full["expected"] == ["Alpha", "Bravo"]
+    assert sorted(full["decoded"]) == ["Alpha", "Bravo"]
+    assert (full["found"], full["recall"], full["ok"]) == ([True, True], 1.0, True)
+
+    partial = records["2L_OQR_2_HL_3.png"]
+    assert (partial["id"], partial["variant"]) == (2, 3)
+    assert partial["decoded"] == ["Charlie"]
+    assert (partial["found"], partial["recall"], partial["ok"]) == ([True, False], 0.5, False)
+
+    other = records["other.png"]
+    assert other["layers"] is None and other["expected"] is None
+    assert other["decoded"] == ["Echo"]
+    assert (other["found"], other["recall"], other["ok"]) == (None, None, None)
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_batch_main_writes_rows_and_recall(tmp_path, capsys, fmt):
+    image_dir = _batch_dataset(tmp_path)
+    output = tmp_path / f"results.{fmt}"
+    assert decoder.batch_main([str(image_dir), "-o", str(output), "-w", "1"]) == 0
+
+    if fmt == "jsonl":
+        rows = [json.loads(line) for line in output.read_text().splitlines()]
+    else:
+        with open(output, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert list(rows[0]) == list(decoder.BATCH_FIELDS)
+    rows = {os.path.basename(row["file"]): row for row in rows}
+    assert len(rows) == 3
+
+    partial = rows["2L_OQR_2_HL_3.png"]
+    if fmt == "csv":
+        # Lists are JSON encoded, other values as written by csv
+        assert json.loads(partial["expected"]) == ["Charlie", "Delta"]
+        assert (partial["recall"], partial["ok"], rows["other.png"]["recall"]) == ("0.5", "False", "")
+    else:
+        assert partial["expected"] == ["Charlie", "Delta"]
+        assert (partial["recall"], partial["ok"], rows["other.png"]["recall"]) == (0.5, False, None)
+
+    assert "Recall: 3/4 layers (75.0%), 1/2 images fully decoded" in capsys.readouterr().err
+
+
+def _write_video(path, frames):
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 25, (width, height))
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def _shifted(img, shift, width):
+    """img at x offset shift on a white canvas width pixels wide."""
+    frame = np.full((img.shape[0], width, 3), 255, dtype=np.uint8)
+    frame[:, shift:shift + img.shape[1]] = img
+    return frame
+
+
+def _noise_frames(count, size=(240, 320)):
+    """Frames different enough from each other not to be skipped, with no code."""
+    rng = np.random.default_rng(3)
+    return [rng.integers(0, 256, size + (3,), dtype=np.uint8) for _ in range(count)]
+
+
+def _counting_bwdecoder(monkeypatch, delay=0.0):
+    calls = []
+    bwdecoder = decoder.bwdecoder
+
+    def counting(*args, **kwargs):
+        calls.append(1)
+        time.sleep(delay)
+        return bwdecoder(*args, **kwargs)
+
+    monkeypatch.setattr(decoder, "bwdecoder", counting)
+    return calls
+
+
+def _capture_threads():
+    return [t for t in threading.enumerate() if t.name == "capture-reader"]
+
+
+def test_decode_from_capture_stops_once_values_are_found(tmp_path, monkeypatch):
+    codes, _ = _two_codes("Alpha", "Bravo")
+    # The codes move a little every frame, so no frame is skipped as a repeat
+    frames = [_shifted(codes, i % 40, codes.shape[1] + 40) for i in range(200)]
+    path = _write_video(tmp_path / "codes.avi", frames)
+    calls = _counting_bwdecoder(monkeypatch)
+
+    v1, v2, v3 = decoder.decode_from_capture(path, qr_type="2", timeout=60)
+    assert sorted([v1, v2]) == ["Alpha", "Bravo"] and v3 is None
+    assert len(calls) < 20
+    assert not _capture_threads()
+
+
+def test_decode_from_capture_joins_reader_after_timeout(tmp_path, monkeypatch):
+    path = _write_video(tmp_path / "noise.avi", _noise_frames(300))
+    _counting_bwdecoder(monkeypatch, delay=0.2)
+
+    start = time.time()
+    assert decoder.decode_from_capture(path, qr_type="2", timeout=1) == (None, None, None)
+    assert time.time() - start < 3
+    assert not _capture_threads()
+
+
+def test_decode_from_capture_decodes_every_frame_to_end_of_file(tmp_path, monkeypatch):
+    path = _write_video(tmp_path / "noise.avi", _noise_frames(8))
+    # Decoding slower than reading: a file's frames must wait, not be dropped
+    calls = _counting_bwdecoder(monkeypatch, delay=0.05)
+
+    assert decoder.decode_from_capture(path, qr_type="2", timeout=60, workers=1) == (None, None, None)
+    assert len(calls) == 8
+    assert not _capture_threads()
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import encoder
+from generated_cache import GeneratedCache, artifact_key, write_atomic
+
+
+def _encode_fresh(tmp_path, monkeypatch, *args):
+    """encode() in tmp_path, with a cache of its own."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(encoder, "_generated_cache", None)
+    return encoder.encode(*args)
+
+
+def _write_entry(cache, key, exts):
+    """Files of a cache entry: an OQR with extension exts[0], then its siblings."""
+    os.makedirs(cache.cache_dir, exist_ok=True)
+    files = {}
+    for i, ext in enumerate(exts):
+        suffix = f"_qr{i}" if i else ""
+        files[suffix] = os.path.join(cache.cache_dir, key + suffix + ext)
+        with open(files[suffix], "wb") as f:
+            f.write(suffix.encode() + b"data")
+    return files
+
+
+def test_put_raises_on_missing_file(tmp_path):
+    cache = GeneratedCache(str(tmp_path))
+    files = _write_entry(cache, "k", [".png", ".png"])
+    files["_qr2"] = os.path.join(cache.cache_dir, "k_qr2.png")
+    with pytest.raises(FileNotFoundError):
+        cache.put("k", files)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+
+def test_vector_entry_links_png_siblings(tmp_path):
+    cache = GeneratedCache(str(tmp_path))
+    # An earlier raster OQR under the same name had a third sibling
+    stale = tmp_path / "oqr_qr3.png"
+    stale.write_bytes(b"old")
+
+    files = _write_entry(cache, "k", [".svg", ".png", ".png"])
+    cache.put("k", files)
+    assert cache.get("k") == files
+    assert cache.stats()["bytes"] == sum(os.path.getsize(f) for f in files.values())
+
+    assert cache.link("k", files, "oqr") == str(tmp_path / "oqr.svg")
+    assert (tmp_path / "oqr_qr1.png").read_bytes() == b"_qr1data"
+    assert (tmp_path / "oqr_qr2.png").read_bytes() == b"_qr2data"
+    assert not stale.exists()
+    cache.close()
+
+
+def test_vector_oqr_siblings_are_linked_and_cached(tmp_path, monkeypatch):
+    path = _encode_fresh(tmp_path, monkeypatch, "vec", "2", "Bravo", "Alpha", None, "svg")
+    generated = os.path.join("static", "generated")
+    assert path == os.path.join(generated, "vec.svg")
+    assert os.path.isfile(os.path.join(generated, "vec_qr1.png"))
+    assert os.path.isfile(os.path.join(generated, "vec_qr2.png"))
+
+    cache = encoder.get_generated_cache()
+    files = cache.get(artifact_key("2", ["H", "L"], ["Alpha", "Bravo"], "svg"))
+    assert sorted(files) == ["", "_qr1", "_qr2"]
+    assert os.path.splitext(files["_qr1"])[1] == os.path.splitext(files["_qr2"])[1] == ".png"
+    # Every file written to the cache is indexed, so eviction can reach it
+    assert sorted(n for n in os.listdir(cache.cache_dir) if not n.startswith(".")) == sorted(os.path.basename(f) for f in files.values())
+    cache.close()
+
+
+@pytest.mark.parametrize("write", [lambda path: False, os.remove])
+def test_write_atomic_keeps_target_when_nothing_is_written(tmp_path, write):
+    target = tmp_path / "oqr.png"
+    target.write_bytes(b"old")
+    # A failed cv2.imwrite returns False and leaves the empty temporary file
+    with pytest.raises(OSError):
+        write_atomic(str(target), write)
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["oqr.png"]
+
+
+def test_failed_sibling_write_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(encoder.cv2, "imwrite", lambda *args: False)
+    assert _encode_fresh(tmp_path, monkeypatch, "fail", "2", "Bravo", "Alpha") is None
+
+    cache = encoder.get_generated_cache()
+    assert cache.stats()["entries"] == 0
+    assert [n for n in os.listdir(cache.cache_dir) if not n.startswith(".")] == []
+    assert not os.path.exists(os.path.join("static", "generated", "fail.png"))
+    cache.close()
@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_utils
+
+
+def _image(shape):
+    return np.random.default_rng(7).integers(0, 256, shape, dtype=np.uint8)
+
+
+def _bands(img, rows):
+    return (img[top:top + rows] for top in range(0, img.shape[0], rows))
+
+
+# 37 rows in bands of 10: the last band is shorter; 70000 wide TIFF rows make
+# one row per strip, so strips and bands don't line up either
+SHAPES = [(37, 23), (37, 23, 3), (5, 70000)]
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+@pytest.mark.parametrize("writer, ext", [
+    (image_utils.write_png_bands, ".png"),
+    (image_utils.write_tiff_bands, ".tiff"),
+])
+def test_band_writers_round_trip(tmp_path, shape, writer, ext):
+    img = _image(shape)
+    path = str(tmp_path / ("out" + ext))
+    writer(path, shape, _bands(img, 10))
+
+    assert np.array_equal(cv2.imread(path, cv2.IMREAD_UNCHANGED), img)
+    with Image.open(path) as pil:
+        read = np.asarray(pil)
+    assert np.array_equal(read, img[:, :, ::-1] if len(shape) == 3 else img)
+
+
+@pytest.mark.parametrize("format_str, writer", [
+    ("png", "write_png_bands"),
+    ("tiff", "write_tiff_bands"),
+    ("tif", "write_tiff_bands"),
+    ("jpg", None),
+    ("bmp", None),
+])
+def test_save_bands_streams_only_streamable_formats(tmp_path, monkeypatch, format_str, writer):
+    calls = []
+    for name in ("write_png_bands", "write_tiff_bands"):
+        monkeypatch.setattr(image_utils, name, lambda *args, name=name: calls.append(name))
+    imwrite = cv2.imwrite
+    monkeypatch.setattr(image_utils.cv2, "imwrite", lambda *args: calls.append("imwrite") or imwrite(*args))
+
+    img = _image((37, 23))
+    path = str(tmp_path / ("out." + format_str))
+    image_utils.save_bands(path, img.shape, _bands(img, 10), format_str)
+
+    assert calls == [writer or "imwrite"]
+    assert image_utils.get_format_info(format_str)["streamable"] == (writer is not None)
+    if writer is None and format_str == "bmp":
+        assert np.array_equal(cv2.imread(path, cv2.IMREAD_UNCHANGED), img)
+
+
+def test_save_bands_raises_when_opencv_cannot_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_utils.cv2, "imwrite", lambda *args: False)
+    img = _image((37, 23))
+    with pytest.raises(OSError):
+        image_utils.save_bands(str(tmp_path / "out.jpg"), img.shape, _bands(img, 10), "jpg")
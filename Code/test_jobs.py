@@ -0,0 +1,98 @@
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+import pytest
+
+import decoder
+from decode_cache import DecodeCache, content_key
+from jobs import JobQueue, QueueFull, decode_upload
+
+
+def _png(text):
+    """PNG bytes of a standard QR code of text."""
+    img = cv2.QRCodeEncoder.create().encode(text)
+    img = cv2.resize(img, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+    img = cv2.copyMakeBorder(img, 32, 32, 32, 32, cv2.BORDER_CONSTANT, value=255)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def _wait(queue, job_id, timeout=60):
+    return queue._jobs[job_id]["future"].result(timeout=timeout)
+
+
+def _decode_workers():
+    return decoder.DECODE_WORKERS
+
+
+def _kill_worker():
+    # As the OOM killer would
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(**kwargs):
+        queues.append(JobQueue(**kwargs))
+        return queues[-1]
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def test_workers_share_decodes_through_the_cache_file(tmp_path, make_queue):
+    path = str(tmp_path / "cache" / "decode.sqlite")
+    queue = make_queue(workers=2, decode_cache_db=path)
+    data = _png("Alpha")
+    assert _wait(queue, queue.submit("decode", decode_upload, data, "upload.png", "1"))[0] == "Alpha"
+
+    # The worker created the file and stored its result there, under the
+    # key of the upload's bytes, layers and mode
+    cache = DecodeCache(db_path=path)
+    key = content_key(np.frombuffer(data, dtype=np.uint8))
+    assert cache.get(f"{key}:1:blur") == {"values": ["Alpha"], "variants": ["raw"]}
+    assert cache.get(f"{key}:2:blur") is None
+    cache.close()
+
+
+def test_submit_past_max_pending_raises_queue_full(make_queue):
+    queue = make_queue(workers=1, max_pending=2, decode_cache_db=None)
+    queue.submit("sleep", time.sleep, 2)
+    queue.submit("sleep", time.sleep, 0)
+    with pytest.raises(QueueFull):
+        queue.submit("sleep", time.sleep, 0)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="no SIGKILL")
+def test_pool_is_started_again_after_a_worker_is_killed(make_queue):
+    queue = make_queue(workers=1, decode_cache_db=None)
+    first = _wait(queue, queue.submit("pid", os.getpid))
+    executor = queue._executor
+
+    job_id = queue.submit("kill", _kill_worker)
+    with pytest.raises(BrokenProcessPool):
+        _wait(queue, job_id)
+    assert queue.status(job_id)["status"] == "failed"
+
+    assert _wait(queue, queue.submit("pid", os.getpid)) != first
+    assert queue._executor is not executor
+
+
+@pytest.mark.parametrize("cpus, workers, threads", [(1, None, 1), (1, 4, 1), (16, None, 1), (16, 4, 4), (16, 3, 5)])
+def test_decode_threads_share_out_the_cpus(monkeypatch, cpus, workers, threads):
+    monkeypatch.setattr(os, "cpu_count", lambda: cpus)
+    queue = JobQueue(workers=workers, decode_cache_db=None)
+    assert queue.workers == (workers or cpus)
+    assert queue.decode_threads == threads
+    assert JobQueue(workers=workers, decode_threads=2, decode_cache_db=None).decode_threads == 2
+
+
+def test_workers_decode_on_their_share_of_threads(make_queue):
+    queue = make_queue(workers=2, decode_threads=3, decode_cache_db=None)
+    assert _wait(queue, queue.submit("threads", _decode_workers)) == 3
@@ -0,0 +1,66 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from Processing.OQRGenerator import OQR_Generator
+from Processing.qrcode import constants, exceptions
+
+# Checksums of the baseline per-module merge loops' output on the inputs below,
+# which the block-view merges must reproduce pixel for pixel
+MERGE_NF_SHA256 = "3c824370fde78f2d41336b048746c28305c940fc8b94074ff3c3c2172c17644d"
+MERGE_NNF_SHA256 = "a484dfbcf050bcd1efd90e55cecc85a8361d1d1f0b0555e72d63f55e9f02343f"
+OQR_SHA256 = {
+    "2": "c3c103b48b74c23224118d7a0d922d3b2d28df3d16f968662059d69b995e41d6",
+    "3": "c8fde2921e71ba00a722fb8c129b0a264be92490e656765b29bf2d76ac7aa639",
+}
+
+
+def _sha256(img):
+    return hashlib.sha256(np.ascontiguousarray(img).tobytes()).hexdigest()
+
+
+def _layers():
+    rng = np.random.default_rng(2024)
+    return [rng.integers(0, 2, (21, 21)).astype(bool).tolist() for _ in range(3)]
+
+
+def test_merge_nf_matches_baseline():
+    nnqr, nqr, fqr = _layers()
+    img = OQR_Generator().merge_nf(nqr, fqr, 50)
+    assert img.shape == (1050, 1050)
+    assert _sha256((img * 255).astype(np.uint8)) == MERGE_NF_SHA256
+
+
+def test_merge_nnf_matches_baseline():
+    nnqr, nqr, fqr = _layers()
+    img = OQR_Generator().merge_nnf(nnqr, nqr, fqr, 150)
+    assert img.shape == (3150, 3150)
+    assert _sha256((img * 255).astype(np.uint8)) == MERGE_NNF_SHA256
+
+
+@pytest.mark.parametrize("type, error, values", [
+    ("2", ["H", "L"], ["Fresh Bread Now", "http://baker.co"]),
+    ("3", ["H", "H", "L"], ["Nearest", "Middle", "Farthest"]),
+])
+def test_generate_oqr_matches_baseline(type, error, values):
+    img = OQR_Generator().generateOQR("test", type, error, values)[0]
+    assert img.dtype == np.uint8
+    assert _sha256(img) == OQR_SHA256[type]
+
+
+def test_align_versions_up_to_version_40():
+    generator = OQR_Generator()
+    L, H = constants.ERROR_CORRECT_L, constants.ERROR_CORRECT_H
+    values = ["x" * 2900, "short"]
+    version, padded = generator.alignVersions(values, [L, H])
+    assert version == 40
+    assert padded[0] == values[0]
+    assert padded[1].rstrip(" ") == "short"
+    assert generator.qr_helper.fitQRVersion(padded[1], H) == 40
+
+
+def test_fit_qr_version_past_version_40():
+    assert OQR_Generator().qr_helper.fitQRVersion("x" * 3000, constants.ERROR_CORRECT_L) == 41
+    with pytest.raises(exceptions.DataOverflowError):
+        OQR_Generator().alignVersions(["x" * 3000, "short"], [constants.ERROR_CORRECT_L, constants.ERROR_CORRECT_H])